@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+'''
+Build
+
+Compiles a Jack program to Hack machine code in one process. The compiler
+from projects/10 produces VM commands, the VM translator from projects/08
+turns them into assembly, and the assembler from projects/06 encodes the
+instruction words. Each stage hands its output to the next in memory, so
+the .vm and .asm files are neither written nor parsed back in unless
+asked for. The time spent in each stage is reported.
+
+With --profile the program is run on the Hack emulator from projects/06,
+and the cycles spent are reported per VM function and per VM command.
+
+    build.py projects/11/Pong projects/12
+
+builds projects/11/Pong/Pong.hack from the game and the OS. Directories
+may also hold compiled .vm files; a .jack file beside a .vm file of the
+same name takes precedence.
+'''
+
+from __future__ import print_function
+
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+for project in ['06', '08', '10']:
+    sys.path.insert(0, os.path.join(ROOT, 'projects', project))
+
+import rom
+from assembler import Assembler, Code, Parser, SymbolTable
+from emulator import Profiler, hot_spots
+from symbols import write_symbols
+from JackAnalyzer import CompilationEngine, JackTokenizer, VMWriter
+from VMtranslator import (CallGraph, CodeWriter, Parser as VMParser,
+    format_dead_code, translate_all)
+
+
+class Build(object):
+    '''One build of a program from its .jack and .vm sources.
+
+    Options are those of VMtranslator.CodeWriter. Set vm=True to also write
+    each compiled class to X.vm beside X.jack; asm names a file to write
+    the assembly to. Set strip=True to link only the functions Sys.init
+    can reach; the rest are kept in self.dead_files. Classes are
+    translated in jobs worker processes (None for one per core). Set
+    source_map=True to keep the VM command behind each ROM address in
+    self.source_map, as CodeWriter.source_map_dict returns it. Label and
+    variable addresses are kept in self.symbols, a symbols.SymbolIndex.
+    '''
+    def __init__(self, paths, vm=False, asm=None, comments=False,
+            optimize=False, shared_calls=False, shared_compare=False,
+            optimize_vm=False, cache_stack=False, strip=False, jobs=1,
+            source_map=False):
+        self.timings = [] # (stage, seconds)
+        self.options = {'comments': comments, 'optimize': optimize,
+            'shared_calls': shared_calls, 'shared_compare': shared_compare,
+            'optimize_vm': optimize_vm, 'cache_stack': cache_stack}
+        self.source_map = None
+
+        start = time.time()
+        classes = self.compile(find_sources(paths), vm)
+        start = self.record_time('compile', start)
+        self.dead_files = []
+        if strip:
+            classes, self.dead_files = CallGraph(classes).split(classes)
+            start = self.record_time('strip', start)
+        self.lines = self.translate(classes, jobs, source_map)
+        if asm:
+            with open(asm, 'w') as f:
+                f.write(''.join([line + '\n' for line in self.lines]))
+        start = self.record_time('translate', start)
+        self.words = self.assemble(self.lines)
+        self.record_time('assemble', start)
+
+    def compile(self, sources, vm=False):
+        '''Return [(class name, VM commands)] in the order of sources'''
+        classes = []
+        for name, filename in sources:
+            if filename.endswith('.vm'):
+                classes.append((name, list(VMParser(filename))))
+                continue
+            vm_writer = VMWriter(filename.replace('.jack', '.vm') if vm else None)
+            engine = CompilationEngine(JackTokenizer(filename), vm_writer)
+            engine.compile_class()
+            engine.close()
+            classes.append((name, vm_writer.commands))
+        return classes
+
+    def translate(self, classes, jobs=1, source_map=False):
+        '''Return the assembly for all classes, one line per item'''
+        cw = CodeWriter(None, source_map=source_map, **self.options)
+        cw.write_init()
+        translate_all(cw, classes, jobs)
+        cw.close()
+        if source_map:
+            self.source_map = cw.source_map_dict()
+        return cw.lines
+
+    def assemble(self, lines):
+        assembler = Assembler(Parser(), SymbolTable(), Code())
+        assembler.assemble_lines(lines)
+        self.symbols = assembler.symbol_index()
+        return assembler.words
+
+    def write(self, out_filename):
+        '''Write a .hack file, or a packed ROM image if the name ends in .rom'''
+        start = time.time()
+        if out_filename.endswith('.rom'):
+            rom.write_rom(out_filename, self.words)
+        else:
+            rom.write_hack(out_filename, self.words)
+        self.record_time('write', start)
+
+    def profile(self, max_cycles, ram=None):
+        '''Run the program; return a Profiler with its counts'''
+        profiler = Profiler(self.words)
+        for address, value in (ram or {}).items():
+            profiler.ram[address] = value
+        start = time.time()
+        profiler.run(max_cycles)
+        self.record_time('profile', start)
+        return profiler
+
+    def record_time(self, stage, start):
+        '''Record time elapsed since start, return the new start time'''
+        now = time.time()
+        self.timings.append((stage, now - start))
+        return now
+
+
+def find_sources(paths):
+    '''Return [(class name, filename)] sorted by name, for a stable ROM.
+
+    Each path is a .jack or .vm file or a directory of them. A class
+    defined in more than one place is an error.
+    '''
+    sources = {}
+    for path in paths:
+        if os.path.isdir(path):
+            filenames = [os.path.join(path, filename) for filename in os.listdir(path)]
+        elif os.path.splitext(path)[1] in ('.jack', '.vm'):
+            filenames = [path]
+        else:
+            raise ValueError('{} is not a .jack or .vm file or a directory'.format(path))
+        found = {}
+        for filename in filenames:
+            name, extension = os.path.splitext(os.path.basename(filename))
+            if extension == '.jack' or (extension == '.vm' and name not in found):
+                found[name] = filename
+        for name, filename in found.items():
+            if name in sources:
+                raise ValueError('{} is defined in {} and {}'.format(
+                    name, sources[name], filename))
+            sources[name] = filename
+    if not sources:
+        raise ValueError('No .jack or .vm files in {}'.format(' '.join(paths)))
+    return sorted(sources.items())
+
+def default_out_filename(path):
+    '''Prog.hack beside Prog.jack, or Dir/Dir.hack for a directory'''
+    path = path.rstrip('/')
+    if os.path.isdir(path):
+        return os.path.join(path, os.path.basename(path) + '.hack')
+    return os.path.splitext(path)[0] + '.hack'
+
+
+if __name__ == '__main__':
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(description='Jack to Hack Build')
+    arg_parser.add_argument('paths', nargs='+',
+        help='.jack or .vm files or directories; the first names the program')
+    arg_parser.add_argument('-o', '--output',
+        help='output file, .hack or .rom (default: beside the first path)')
+    arg_parser.add_argument('--vm', action='store_true',
+        help='also write X.vm beside each X.jack')
+    arg_parser.add_argument('--asm',
+        help='also write the assembly, with comments, to this file')
+    arg_parser.add_argument('-j', '--jobs', type=int, default=1,
+        help='worker processes for translation, 0 for one per core (default: 1)')
+    arg_parser.add_argument('--strip', action='store_true',
+        help='leave out functions Sys.init never calls, and report them')
+    arg_parser.add_argument('--optimize', action='store_true',
+        help='run the peephole optimizer over the assembly')
+    arg_parser.add_argument('--optimize-vm', action='store_true',
+        help='fold constants and fuse VM commands before translating them')
+    arg_parser.add_argument('--cache-stack', action='store_true',
+        help='keep the top of the stack in D and R14/R15 between commands')
+    arg_parser.add_argument('--shared-calls', action='store_true',
+        help='share one call and one return routine between all call sites')
+    arg_parser.add_argument('--shared-compare', action='store_true',
+        help='share one routine per comparison operator between all uses')
+    arg_parser.add_argument('--map',
+        help='also write the VM command behind each ROM address to this file')
+    arg_parser.add_argument('--symbols',
+        help='also write label and variable addresses to this .sym file')
+    arg_parser.add_argument('--profile', action='store_true',
+        help='run the program and report the hottest VM functions and commands')
+    arg_parser.add_argument('--max-cycles', type=int, default=10 ** 7,
+        help='stop profiling after this many instructions (default: 10M)')
+    arg_parser.add_argument('--set', nargs='*', default=[], metavar='ADDRESS=VALUE',
+        help='initial RAM contents for profiling')
+    arg_parser.add_argument('--top', type=int, default=20,
+        help='rows per profile table (default: 20)')
+    args = arg_parser.parse_args()
+
+    start = time.time()
+    build = Build(args.paths, vm=args.vm, asm=args.asm,
+        comments=args.asm is not None, optimize=args.optimize,
+        shared_calls=args.shared_calls, shared_compare=args.shared_compare,
+        optimize_vm=args.optimize_vm, cache_stack=args.cache_stack,
+        strip=args.strip, jobs=args.jobs or None,
+        source_map=args.map is not None or args.profile)
+    out_filename = args.output or default_out_filename(args.paths[0])
+    build.write(out_filename)
+    if args.symbols:
+        write_symbols(args.symbols, build.symbols)
+    if args.map:
+        with open(args.map, 'w') as f:
+            json.dump(build.source_map, f)
+    profiler = None
+    if args.profile:
+        ram = {}
+        for assignment in args.set:
+            address, value = assignment.split('=')
+            ram[int(address)] = int(value)
+        profiler = build.profile(args.max_cycles, ram)
+    for stage, seconds in build.timings:
+        print('  {}: {:.4f}s'.format(stage, seconds))
+    print('{}: {} instructions in {:.4f}s'.format(
+        out_filename, len(build.words), time.time() - start))
+    if args.strip:
+        print(format_dead_code(build.dead_files, build.options))
+    if profiler:
+        print('{} cycles, {}'.format(profiler.cycles,
+            'halted' if profiler.halted else 'cycle limit reached'))
+        print('\n'.join(hot_spots(profiler.counts(), build.source_map, args.top)))
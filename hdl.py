@@ -0,0 +1,710 @@
+#!/usr/bin/env python
+'''
+HDL Simulator
+
+Loads the .hdl chips from projects/01-05 and compiles each one into a
+single generated Python function: the chip is flattened part by part,
+every pin becomes a local variable holding a NumPy array with one lane
+per input vector, and the resulting operations are sorted so that each
+runs after the pins it reads. One call therefore evaluates the chip for
+thousands of input vectors at once.
+
+Parts are resolved the way the supplied HardwareSimulator resolves them:
+an .hdl file in the same directory as the chip wins, anything else is a
+built-in chip implemented directly in NumPy. Clocked built-ins (DFF,
+Register, RAM8 ... RAM16K, PC, CPU, ...) keep their state per lane; tick
+latches their next state and tock commits it.
+
+Run against a chip file, it checks the chip against the built-in chip of
+the same name: exhaustively when the inputs are narrow enough, otherwise
+on random vectors, and over random input sequences for clocked chips.
+'''
+
+from __future__ import print_function
+
+import os
+import re
+import time
+
+import numpy as np
+
+TOKENS = re.compile(r'//[^\n]*|/\*.*?\*/|(\w+|\.\.|\S)', re.DOTALL)
+VARIABLE = re.compile(r'\bv\d+\b')
+CONSTANT = re.compile(r'^[\d\s()&|<>]+$')
+
+
+def mask(width):
+    return (1 << width) - 1
+
+
+def pin_list(spec):
+    '''"a[16] b sel" -> [('a', 16), ('b', 1), ('sel', 1)]'''
+    pins = []
+    for pin in spec.split():
+        name, _, width = pin.partition('[')
+        pins.append((name, int(width.rstrip(']')) if width else 1))
+    return pins
+
+
+class Chip(object):
+    '''A chip parsed from HDL'''
+    def __init__(self, name, inputs, outputs, parts):
+        self.name = name
+        self.inputs = inputs
+        self.outputs = outputs
+        self.parts = parts # [(chip name, [(pin, range, signal, range)])]
+
+
+class Parser(object):
+    '''Parses a CHIP definition from an .hdl file'''
+    def __init__(self, hdl_filename):
+        with open(hdl_filename) as f:
+            self.tokens = [t for t in TOKENS.findall(f.read()) if t]
+        self.filename = hdl_filename
+        self.position = 0
+
+    def advance(self):
+        if self.position >= len(self.tokens):
+            raise ValueError('{}: unexpected end of file'.format(self.filename))
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def expect(self, expected):
+        token = self.advance()
+        if token != expected:
+            raise ValueError('{}: expected {}, got {}'.format(self.filename, expected, token))
+
+    def parse(self):
+        self.expect('CHIP')
+        name = self.advance()
+        self.expect('{')
+        inputs, outputs, parts = [], [], []
+        while self.peek() != '}':
+            section = self.advance()
+            if section == 'IN':
+                inputs = self.parse_pins()
+            elif section == 'OUT':
+                outputs = self.parse_pins()
+            elif section == 'PARTS':
+                self.expect(':')
+                while self.peek() != '}':
+                    parts.append(self.parse_part())
+            else:
+                raise ValueError('{}: {} is not supported'.format(self.filename, section))
+        return Chip(name, inputs, outputs, parts)
+
+    def parse_pins(self):
+        pins = []
+        while True:
+            name = self.advance()
+            width = 1
+            if self.peek() == '[':
+                self.advance()
+                width = int(self.advance())
+                self.expect(']')
+            pins.append((name, width))
+            if self.advance() == ';':
+                return pins
+
+    def parse_part(self):
+        name = self.advance()
+        self.expect('(')
+        connections = []
+        while True:
+            pin, pin_range = self.parse_signal()
+            self.expect('=')
+            signal, signal_range = self.parse_signal()
+            connections.append((pin, pin_range, signal, signal_range))
+            if self.advance() == ')':
+                break
+        self.expect(';')
+        return name, connections
+
+    def parse_signal(self):
+        '''Return (name, (low, high) or None)'''
+        name = self.advance()
+        if self.peek() != '[':
+            return name, None
+        self.advance()
+        low = high = int(self.advance())
+        if self.peek() == '..':
+            self.advance()
+            high = int(self.advance())
+        self.expect(']')
+        return name, (low, high)
+
+
+class Builtin(object):
+    '''A chip implemented directly in NumPy, as templates of Python statements'''
+    def __init__(self, inputs, outputs, evaluate, clocked='', tick=None,
+            tock='{state} = {pending}', state=None):
+        self.name = None
+        self.inputs = pin_list(inputs)
+        self.outputs = pin_list(outputs)
+        self.evaluate = evaluate
+        self.clocked = set(clocked.split())
+        self.tick = tick
+        self.tock = tock
+        self.state = state # batch size -> initial state
+
+
+def register_state(batch):
+    return np.zeros(batch, np.uint16)
+
+
+def memory_state(size):
+    return lambda batch: np.zeros((batch, size), np.uint16)
+
+
+def rom_state(batch):
+    return np.zeros(32768, np.uint16)
+
+
+def cpu_state(batch):
+    return (register_state(batch), register_state(batch), register_state(batch))
+
+
+def alu(x, y, zx, nx, zy, ny, f, no):
+    x = np.where(zx, 0, x)
+    x = np.where(nx, ~x & 0xFFFF, x)
+    y = np.where(zy, 0, y)
+    y = np.where(ny, ~y & 0xFFFF, y)
+    out = np.where(f, (x + y) & 0xFFFF, x & y)
+    out = np.where(no, ~out & 0xFFFF, out)
+    return out, np.where(out, 0, 1), out >> 15
+
+
+def cpu_alu(state, inM, instruction):
+    a, d, pc = state
+    y = np.where(instruction >> 12 & 1, inM, a)
+    return alu(d, y, instruction >> 11 & 1, instruction >> 10 & 1,
+        instruction >> 9 & 1, instruction >> 8 & 1, instruction >> 7 & 1,
+        instruction >> 6 & 1)
+
+
+def cpu_outputs(state, inM, instruction):
+    '''outM and writeM'''
+    out, zr, ng = cpu_alu(state, inM, instruction)
+    return out, instruction >> 15 & instruction >> 3 & 1
+
+
+def cpu_next(state, inM, instruction, reset):
+    '''Next (A, D, PC)'''
+    a, d, pc = state
+    out, zr, ng = cpu_alu(state, inM, instruction)
+    c = instruction >> 15
+    positive = (ng ^ 1) & (zr ^ 1)
+    jump = c & ((instruction >> 2 & ng) | (instruction >> 1 & zr)
+        | (instruction & positive)) & 1
+    return (np.where(c, np.where(instruction >> 5 & 1, out, a), instruction),
+        np.where(c & instruction >> 4 & 1, out, d),
+        np.where(reset, 0, np.where(jump, a, (pc + 1) & 0xFFFF)))
+
+
+def write_memory(memory, lanes, pending, size=None):
+    '''Apply a latched (address, value, load) write to a (lanes, words) array'''
+    address, value, load = (np.broadcast_to(x, lanes.shape) for x in pending)
+    load = load != 0
+    if size is not None:
+        load &= address < size
+    memory[lanes[load], address[load]] = value[load]
+
+
+def ram(size, address_width):
+    return Builtin('in[16] load address[{}]'.format(address_width), 'out[16]',
+        ['{out} = {state}[lanes, {address}]'],
+        clocked='in load',
+        tick=['{pending} = ({address}, {in}, {load})'],
+        tock='write_memory({state}, lanes, {pending})',
+        state=memory_state(size))
+
+
+def register(width):
+    return Builtin('in[{0}] load'.format(width), 'out[{0}]'.format(width),
+        ['{out} = {state}'],
+        clocked='in load',
+        tick=['{pending} = np.where({load}, {in}, {state})'],
+        state=register_state)
+
+
+BUILTINS = {
+    'Nand': Builtin('a b', 'out', ['{out} = ({a} & {b}) ^ 1']),
+    'Not': Builtin('in', 'out', ['{out} = {in} ^ 1']),
+    'And': Builtin('a b', 'out', ['{out} = {a} & {b}']),
+    'Or': Builtin('a b', 'out', ['{out} = {a} | {b}']),
+    'Xor': Builtin('a b', 'out', ['{out} = {a} ^ {b}']),
+    'Mux': Builtin('a b sel', 'out', ['{out} = np.where({sel}, {b}, {a})']),
+    'DMux': Builtin('in sel', 'a b', ['{a} = {in} & ({sel} ^ 1)', '{b} = {in} & {sel}']),
+    'Not16': Builtin('in[16]', 'out[16]', ['{out} = ~{in} & 0xFFFF']),
+    'And16': Builtin('a[16] b[16]', 'out[16]', ['{out} = {a} & {b}']),
+    'Or16': Builtin('a[16] b[16]', 'out[16]', ['{out} = {a} | {b}']),
+    'Mux16': Builtin('a[16] b[16] sel', 'out[16]', ['{out} = np.where({sel}, {b}, {a})']),
+    'Mux4Way16': Builtin('a[16] b[16] c[16] d[16] sel[2]', 'out[16]',
+        ['{out} = np.choose({sel}, [{a}, {b}, {c}, {d}])']),
+    'Mux8Way16': Builtin('a[16] b[16] c[16] d[16] e[16] f[16] g[16] h[16] sel[3]', 'out[16]',
+        ['{out} = np.choose({sel}, [{a}, {b}, {c}, {d}, {e}, {f}, {g}, {h}])']),
+    'DMux4Way': Builtin('in sel[2]', 'a b c d',
+        ['{{{}}} = np.where({{sel}} == {}, {{in}}, 0)'.format(pin, i)
+            for i, pin in enumerate('abcd')]),
+    'DMux8Way': Builtin('in sel[3]', 'a b c d e f g h',
+        ['{{{}}} = np.where({{sel}} == {}, {{in}}, 0)'.format(pin, i)
+            for i, pin in enumerate('abcdefgh')]),
+    'Or8Way': Builtin('in[8]', 'out', ['{out} = np.where({in} & 0xFF, 1, 0)']),
+    'HalfAdder': Builtin('a b', 'sum carry', ['{sum} = {a} ^ {b}', '{carry} = {a} & {b}']),
+    'FullAdder': Builtin('a b c', 'sum carry',
+        ['{sum} = {a} ^ {b} ^ {c}', '{carry} = ({a} & {b}) | ({c} & ({a} ^ {b}))']),
+    'Add16': Builtin('a[16] b[16]', 'out[16]', ['{out} = ({a} + {b}) & 0xFFFF']),
+    'Inc16': Builtin('in[16]', 'out[16]', ['{out} = ({in} + 1) & 0xFFFF']),
+    'ALU': Builtin('x[16] y[16] zx nx zy ny f no', 'out[16] zr ng',
+        ['{out}, {zr}, {ng} = alu({x}, {y}, {zx}, {nx}, {zy}, {ny}, {f}, {no})']),
+    'DFF': Builtin('in', 'out', ['{out} = {state}'],
+        clocked='in', tick=['{pending} = {in}'], state=register_state),
+    'Bit': register(1),
+    'Register': register(16),
+    'ARegister': register(16),
+    'DRegister': register(16),
+    'PC': Builtin('in[16] load inc reset', 'out[16]', ['{out} = {state}'],
+        clocked='in load inc reset',
+        tick=['{pending} = np.where({reset}, 0, np.where({load}, {in}, '
+            'np.where({inc}, ({state} + 1) & 0xFFFF, {state})))'],
+        state=register_state),
+    'RAM8': ram(8, 3),
+    'RAM64': ram(64, 6),
+    'RAM512': ram(512, 9),
+    'RAM4K': ram(4096, 12),
+    'RAM16K': ram(16384, 14),
+    'Screen': ram(8192, 13),
+    'Keyboard': Builtin('', 'out[16]', ['{out} = {state}'], state=register_state),
+    'ROM32K': Builtin('address[15]', 'out[16]', ['{out} = {state}[{address}]'],
+        state=rom_state),
+    'Memory': Builtin('in[16] load address[15]', 'out[16]',
+        ['{out} = {state}[lanes, np.minimum({address}, 24576)]'],
+        clocked='in load',
+        tick=['{pending} = ({address}, {in}, {load})'],
+        tock='write_memory({state}, lanes, {pending}, 24576)',
+        state=memory_state(24577)),
+    'CPU': Builtin('inM[16] instruction[16] reset', 'outM[16] writeM addressM[15] pc[15]',
+        ['{outM}, {writeM} = cpu_outputs({state}, {inM}, {instruction})',
+            '{addressM} = {state}[0] & 0x7FFF',
+            '{pc} = {state}[2] & 0x7FFF'],
+        clocked='reset',
+        tick=['{pending} = cpu_next({state}, {inM}, {instruction}, {reset})'],
+        state=cpu_state),
+}
+for name, builtin in BUILTINS.items():
+    builtin.name = name
+
+NAMESPACE = {
+    'np': np,
+    'alu': alu,
+    'cpu_outputs': cpu_outputs,
+    'cpu_next': cpu_next,
+    'write_memory': write_memory,
+}
+
+
+class Library(object):
+    '''Resolves chip names: .hdl files in one directory, then built-ins'''
+    def __init__(self, directory):
+        self.directory = directory
+        self.chips = {}
+
+    def load(self, hdl_filename):
+        chip = Parser(hdl_filename).parse()
+        self.chips[chip.name] = chip
+        return chip
+
+    def lookup(self, name):
+        if name not in self.chips:
+            hdl_filename = os.path.join(self.directory, name + '.hdl')
+            if os.path.exists(hdl_filename):
+                self.load(hdl_filename)
+            elif name in BUILTINS:
+                self.chips[name] = BUILTINS[name]
+            else:
+                raise ValueError('{} is not a known chip'.format(name))
+        return self.chips[name]
+
+
+class Netlist(object):
+    '''A chip flattened into one generated evaluate() function'''
+    def __init__(self, chip, library):
+        self.chip = chip
+        self.library = library
+        self.variable_count = 0
+        self.operations = [] # [(statement, variables read, variables written)]
+        self.ticks = []
+        self.tocks = []
+        self.states = [] # [Builtin]
+
+        inputs = dict((pin, self.variable()) for pin, width in chip.inputs)
+        outputs = dict((pin, self.variable()) for pin, width in chip.outputs)
+        self.expand(chip, inputs, outputs)
+        self.source = self.generate(inputs, outputs)
+        namespace = dict(NAMESPACE)
+        exec(compile(self.source, '<{}>'.format(chip.name), 'exec'), namespace)
+        self.evaluate = namespace['evaluate']
+        self.commit = namespace['commit']
+
+    def variable(self):
+        self.variable_count += 1
+        return 'v{}'.format(self.variable_count)
+
+    def emit(self, target, expression):
+        self.operations.append(('{} = {}'.format(target, expression),
+            set(VARIABLE.findall(expression)), set([target])))
+
+    def value(self, expression):
+        '''A variable or literal holding expression'''
+        if CONSTANT.match(expression):
+            return str(eval(expression))
+        if VARIABLE.match(expression) and VARIABLE.match(expression).end() == len(expression):
+            return expression
+        variable = self.variable()
+        self.emit(variable, expression)
+        return variable
+
+    def expand(self, chip, inputs, outputs):
+        '''Emit operations computing chip's outputs from its inputs'''
+        if isinstance(chip, Builtin):
+            return self.expand_builtin(chip, inputs, outputs)
+
+        widths = dict(chip.inputs + chip.outputs)
+        internal = {}
+        pieces = dict((pin, []) for pin, width in chip.outputs)
+        drivers = dict((pin, 0) for pin, width in chip.outputs)
+        for part_name, connections in chip.parts:
+            for pin, pin_range, signal, signal_range in connections:
+                if signal in drivers:
+                    drivers[signal] += 1
+                elif signal not in widths and signal not in ('true', 'false'):
+                    internal.setdefault(signal, self.variable())
+
+        for part_name, connections in chip.parts:
+            part = self.library.lookup(part_name)
+            part_inputs = dict(part.inputs)
+            part_outputs = dict(part.outputs)
+            by_pin = {}
+            for connection in connections:
+                if connection[0] not in part_inputs and connection[0] not in part_outputs:
+                    raise ValueError('{}: {} has no pin {}'.format(chip.name, part_name, connection[0]))
+                by_pin.setdefault(connection[0], []).append(connection)
+
+            values = {}
+            for pin, width in part.inputs:
+                terms = []
+                for _, pin_range, signal, signal_range in by_pin.get(pin, []):
+                    low, high = pin_range or (0, width - 1)
+                    if signal == 'true':
+                        term = str(mask(high - low + 1))
+                    elif signal == 'false':
+                        continue
+                    else:
+                        term = inputs[signal] if signal in inputs else internal[signal]
+                        if signal_range:
+                            term = '({} >> {} & {})'.format(term, signal_range[0],
+                                mask(signal_range[1] - signal_range[0] + 1))
+                    terms.append('{} << {}'.format(term, low) if low else term)
+                values[pin] = self.value(' | '.join('({})'.format(t) for t in terms) or '0')
+
+            results = {}
+            for pin, width in part.outputs:
+                connected = by_pin.get(pin, [])
+                if len(connected) == 1 and connected[0][1] is None and connected[0][3] is None:
+                    signal = connected[0][2]
+                    if signal in internal:
+                        results[pin] = internal[signal]
+                        continue
+                    if signal in outputs and drivers[signal] == 1:
+                        results[pin] = outputs[signal]
+                        continue
+                results[pin] = variable = self.variable()
+                for _, pin_range, signal, signal_range in connected:
+                    low, high = pin_range or (0, width - 1)
+                    term = '{} >> {} & {}'.format(variable, low, mask(high - low + 1))
+                    if signal in outputs:
+                        pieces[signal].append((term, signal_range[0] if signal_range else 0))
+                    else:
+                        self.emit(internal[signal], term)
+            self.expand(part, values, results)
+
+        for pin, width in chip.outputs:
+            if drivers[pin] == 1 and not pieces[pin]:
+                continue
+            terms = ['({}) << {}'.format(term, low) for term, low in pieces[pin]]
+            self.emit(outputs[pin], ' | '.join(terms) or '0')
+
+        written = set()
+        for statement, reads, writes in self.operations:
+            written |= writes
+        for signal, variable in internal.items():
+            if variable not in written:
+                self.emit(variable, '0')
+
+    def expand_builtin(self, builtin, inputs, outputs):
+        names = {}
+        for pin, width in builtin.inputs:
+            names[pin] = inputs.get(pin, '0')
+        for pin, width in builtin.outputs:
+            names[pin] = outputs[pin]
+        if builtin.state:
+            names['state'] = 'state[{}]'.format(len(self.states))
+            names['pending'] = 'pending[{}]'.format(len(self.states))
+            self.states.append(builtin)
+        reads = set(names[pin] for pin, width in builtin.inputs
+            if pin not in builtin.clocked and VARIABLE.match(names[pin]))
+        writes = set(outputs[pin] for pin, width in builtin.outputs)
+        statement = '\n'.join(line.format(**names) for line in builtin.evaluate)
+        self.operations.append((statement, reads, writes))
+        if builtin.tick:
+            self.ticks.extend(line.format(**names) for line in builtin.tick)
+            self.tocks.append(builtin.tock.format(**names))
+
+    def sorted_operations(self):
+        '''Operations ordered so that each runs after everything it reads'''
+        producers = {}
+        for index, (statement, reads, writes) in enumerate(self.operations):
+            for variable in writes:
+                producers[variable] = index
+        waiting = [0] * len(self.operations)
+        consumers = [[] for operation in self.operations]
+        for index, (statement, reads, writes) in enumerate(self.operations):
+            for variable in reads:
+                if variable in producers:
+                    waiting[index] += 1
+                    consumers[producers[variable]].append(index)
+        ready = [index for index, count in enumerate(waiting) if not count]
+        order = []
+        while ready:
+            index = ready.pop()
+            order.append(self.operations[index][0])
+            for consumer in consumers[index]:
+                waiting[consumer] -= 1
+                if not waiting[consumer]:
+                    ready.append(consumer)
+        if len(order) < len(self.operations):
+            raise ValueError('{} has a combinational loop'.format(self.chip.name))
+        return order
+
+    def generate(self, inputs, outputs):
+        '''Python source for evaluate(inputs, state, lanes, latch) and commit()'''
+        lines = ['def evaluate(inputs, state, lanes, latch):']
+        lines.extend("    {} = inputs['{}']".format(inputs[pin], pin) for pin, width in self.chip.inputs)
+        for statement in self.sorted_operations():
+            lines.extend('    ' + line for line in statement.split('\n'))
+        lines.append('    pending = None')
+        if self.ticks:
+            lines.append('    if latch:')
+            lines.append('        pending = [None] * {}'.format(len(self.states)))
+            lines.extend('        ' + line for line in self.ticks)
+        lines.append('    return {{{}}}, pending'.format(', '.join("'{}': {}".format(pin, outputs[pin])
+            for pin, width in self.chip.outputs)))
+        lines.append('')
+        lines.append('def commit(state, lanes, pending):')
+        lines.extend('    ' + line for line in self.tocks or ['pass'])
+        return '\n'.join(lines) + '\n'
+
+
+class Simulator(object):
+    '''Runs a Netlist over a batch of input vectors'''
+    def __init__(self, netlist, batch=1):
+        self.netlist = netlist
+        self.batch = batch
+        self.lanes = np.arange(batch)
+        self.state = [builtin.state(batch) for builtin in netlist.states]
+        self.inputs = dict((pin, np.zeros(batch, np.uint16)) for pin, width in netlist.chip.inputs)
+        self.outputs = {}
+        self.pending = None
+        self.eval()
+
+    @property
+    def clocked(self):
+        return bool(self.netlist.states)
+
+    def set(self, pin, value):
+        self.inputs[pin] = np.broadcast_to(np.asarray(value, np.uint16), (self.batch,))
+
+    def eval(self):
+        self.outputs, _ = self.netlist.evaluate(self.inputs, self.state, self.lanes, False)
+
+    def tick(self):
+        self.outputs, self.pending = self.netlist.evaluate(self.inputs, self.state, self.lanes, True)
+
+    def tock(self):
+        if self.pending is not None:
+            self.netlist.commit(self.state, self.lanes, self.pending)
+            self.pending = None
+        self.eval()
+
+    def output(self, pin):
+        width = dict(self.netlist.chip.outputs)[pin]
+        return np.broadcast_to(np.asarray(self.outputs[pin]) & mask(width), (self.batch,))
+
+    def slot(self, name):
+        '''Index into self.state of the first built-in part called name'''
+        for index, builtin in enumerate(self.netlist.states):
+            if builtin.name == name:
+                return index
+        raise ValueError('{} has no {} part'.format(self.netlist.chip.name, name))
+
+    def peek(self, name, index=0):
+        '''Word index of the built-in part called name, in lane 0.
+
+        Like the supplied simulator, shows a value latched by tick before
+        tock commits it.
+        '''
+        slot = self.slot(name)
+        state = self.state[slot]
+        if self.pending is not None and self.pending[slot] is not None:
+            pending = self.pending[slot]
+            if np.ndim(state) < 2:
+                return int(np.broadcast_to(pending, (self.batch,))[0])
+            address, value, load = (np.broadcast_to(x, (self.batch,))[0] for x in pending)
+            if load and address == index:
+                return int(value)
+        if name == 'ROM32K':
+            return int(state[index])
+        if np.ndim(state) == 2:
+            return int(state[0, index])
+        return int(np.broadcast_to(state, (self.batch,))[0])
+
+    def poke(self, name, index, value):
+        '''Set word index of the built-in part called name, in every lane'''
+        slot = self.slot(name)
+        state = self.state[slot]
+        if name == 'ROM32K':
+            state[index] = value
+        elif np.ndim(state) == 2:
+            state[:, index] = value
+        else:
+            self.state[slot] = np.full(self.batch, value, np.uint16)
+
+    def load_rom(self, words):
+        rom = self.state[self.slot('ROM32K')]
+        rom[:] = 0
+        rom[:len(words)] = words
+        self.eval()
+
+
+def load_chip(hdl_filename):
+    '''Netlist for the chip in hdl_filename'''
+    library = Library(os.path.dirname(hdl_filename) or '.')
+    return Netlist(library.load(hdl_filename), library)
+
+
+def builtin_chip(name):
+    '''Netlist for the built-in chip called name'''
+    return Netlist(BUILTINS[name], Library(None))
+
+
+class Checker(object):
+    '''Compares a chip against the built-in chip of the same name'''
+    def __init__(self, hdl_filename, vectors, cycles, seed=0):
+        self.netlist = load_chip(hdl_filename)
+        name = self.netlist.chip.name
+        if name not in BUILTINS:
+            raise ValueError('{} has no built-in chip to check against'.format(name))
+        self.reference = builtin_chip(name)
+        self.inputs = self.netlist.chip.inputs
+        self.outputs = self.netlist.chip.outputs
+        self.vectors = vectors
+        self.cycles = cycles
+        self.random = np.random.RandomState(seed)
+
+    def check(self):
+        '''Return (description of what was checked, first mismatch or None)'''
+        if self.netlist.states or self.reference.states:
+            return self.check_sequential()
+        width = sum(width for pin, width in self.inputs)
+        if 1 << width <= self.vectors:
+            return '{} vectors (exhaustive)'.format(1 << width), self.check_exhaustive(width)
+        return '{} random vectors'.format(self.vectors), self.check_random()
+
+    def check_exhaustive(self, width, batch=1 << 16):
+        for start in range(0, 1 << width, batch):
+            vectors = np.arange(start, min(start + batch, 1 << width))
+            values, shift = {}, 0
+            for pin, pin_width in self.inputs:
+                values[pin] = (vectors >> shift & mask(pin_width)).astype(np.uint16)
+                shift += pin_width
+            mismatch = self.compare(*self.simulators(len(vectors), values))
+            if mismatch:
+                return mismatch
+
+    def check_random(self, batch=1 << 16):
+        for start in range(0, self.vectors, batch):
+            count = min(batch, self.vectors - start)
+            mismatch = self.compare(*self.simulators(count, self.random_inputs(count)))
+            if mismatch:
+                return mismatch
+
+    def check_sequential(self):
+        lanes = max(1, min(1024, self.vectors // self.cycles))
+        chip, reference = self.simulators(lanes, {})
+        for cycle in range(self.cycles):
+            for pin, values in self.random_inputs(lanes).items():
+                chip.set(pin, values)
+                reference.set(pin, values)
+            for step in ('eval', 'tick', 'tock'):
+                getattr(chip, step)()
+                getattr(reference, step)()
+                mismatch = self.compare(chip, reference, 'cycle {} {}'.format(cycle, step))
+                if mismatch:
+                    return '{} lanes x {} cycles'.format(lanes, self.cycles), mismatch
+        return '{} lanes x {} cycles'.format(lanes, self.cycles), None
+
+    def random_inputs(self, count):
+        return dict((pin, self.random.randint(0, 1 << width, count).astype(np.uint16))
+            for pin, width in self.inputs)
+
+    def simulators(self, batch, values):
+        simulators = Simulator(self.netlist, batch), Simulator(self.reference, batch)
+        for simulator in simulators:
+            for pin, value in values.items():
+                simulator.set(pin, value)
+            simulator.eval()
+        return simulators
+
+    def compare(self, chip, reference, when=None):
+        for pin, width in self.outputs:
+            got, expected = chip.output(pin), reference.output(pin)
+            wrong = np.flatnonzero(got != expected)
+            if len(wrong):
+                lane = wrong[0]
+                inputs = ', '.join('{}={}'.format(name, chip.inputs[name][lane])
+                    for name, _ in self.inputs)
+                return '{}{}: {} is {}, expected {}'.format(when + ', ' if when else '',
+                    inputs, pin, got[lane], expected[lane])
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+
+    arg_parser = argparse.ArgumentParser(
+        description='Check HDL chips against the built-in chips, many vectors at a time')
+    arg_parser.add_argument('hdl_files', nargs='+', help='.hdl files')
+    arg_parser.add_argument('--vectors', type=int, default=1 << 20,
+        help='input vectors per chip; exhaustive when the inputs fit (default: 2^20)')
+    arg_parser.add_argument('--cycles', type=int, default=100,
+        help='clock cycles per run for clocked chips (default: 100)')
+    arg_parser.add_argument('--seed', type=int, default=0)
+    args = arg_parser.parse_args()
+
+    failures = 0
+    for hdl_filename in args.hdl_files:
+        start = time.time()
+        try:
+            checked, mismatch = Checker(hdl_filename, args.vectors, args.cycles, args.seed).check()
+        except ValueError as e:
+            print('{}: {}'.format(hdl_filename, e))
+            failures += 1
+            continue
+        print('{}: {} {}, {} ({:.2f}s)'.format(hdl_filename, 'FAIL' if mismatch else 'ok',
+            checked, mismatch or 'no mismatches', time.time() - start))
+        failures += bool(mismatch)
+    sys.exit(1 if failures else 0)
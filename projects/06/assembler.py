@@ -11,114 +11,422 @@ this with a thinner interface, specifically by minimizing the SymbolTable API
 and integrating Assembler and Parser into a single object.
 '''
 
+from __future__ import print_function
+
+import glob
+import hashlib
+import json
+import os
+import time
+from functools import partial
+from itertools import permutations
+from array import array
+from multiprocessing import Pool
+
+import rom
+import symbols
+
+C_PREFIX = 0b111 << 13 # Leading bits of every C-instruction
+VERSION = '1' # Bump whenever output changes, to invalidate cached assemblies
+CACHE_DIR = '__asmcache__'
+
 
 class Assembler(object):
     def __init__(self, parser, symbol_table, code):
         self.parser = parser
         self.symbol_table = symbol_table
         self.code = code
+        self.timings = [] # (phase, seconds) for the last assemble()
+
+    def assemble(self, asm_filename, single_pass=False, binary=False, cache=False,
+            output=True, sym_file=False):
+        '''Write a .hack file, or a packed .rom image if binary is set.
+
+        With cache set, the result is recorded in an AssemblyCache and
+        reused by later runs (always in single-pass mode). With output
+        unset nothing is written; the program is left in self.words.
+        With sym_file set, a .sym file records where labels and variables
+        went (see symbols.py).
+        '''
+        self.timings = []
+        self.prepare_files(asm_filename, binary)
+        self.output = output
+        self.reset_tables()
+        if cache:
+            self.assemble_cached(AssemblyCache(asm_filename))
+        elif single_pass:
+            self.assemble_single_pass()
+        else:
+            self.assemble_two_pass()
+        self.parser.close_asm()
+        if sym_file and output:
+            start = time.time()
+            self.write_symbols(asm_filename.replace('.asm', '.sym'))
+            self.record_time('symbols', start)
+
+    def assemble_lines(self, lines):
+        '''Assemble lines held in memory (e.g. CodeWriter.lines) in a
+        single pass. Nothing is written; the program is left in self.words.
+        '''
+        self.timings = []
+        self.parser.load_lines(lines)
+        self.output = False
+        self.reset_tables()
+        self.assemble_single_pass()
+        self.parser.close_asm()
+
+    def reset_tables(self):
+        self.ram_address = 16
+        self.words = array('H') # One 16-bit instruction per ROM address
+        self.sources = [] # Instruction text, recorded by the single pass
+        self.labels = [] # [label, ROM address] in order of definition
+        self.variables = [] # In order of allocation
+
+    def assemble_cached(self, cache):
+        start = time.time()
+        if cache.hit:
+            self.sources = cache.entry['sources']
+            self.labels = cache.entry['labels']
+            self.variables = cache.entry['variables']
+            self.words = array('H', cache.entry['words'])
+            if self.output and not cache.output_matches(self.out_filename):
+                self.write_output() # Missing, or changed since it was written
+                cache.save(self)
+            self.record_time('cache hit', start)
+            return
+
+        if cache.entry is not None and self.assemble_incremental(cache.entry):
+            start = time.time()
+            self.write_output()
+            self.record_time('write', start)
+        else:
+            self.sources, self.labels = [], []
+            self.parser.reset_file()
+            self.assemble_single_pass()
+        start = time.time()
+        cache.save(self)
+        self.record_time('cache save', start)
+
+    def assemble_incremental(self, entry):
+        '''Re-encode only the instructions that differ from a cached run.
+
+        Returns False if that is not safe: when a label moved, or when a
+        changed instruction names a variable, which may shift the RAM
+        addresses of every variable allocated after it. Tables are only
+        updated once the edit is known to be safe.
+        '''
+        parser = self.parser
+        sources = self.sources
+        labels = self.labels
+
+        start = time.time()
+        while parser.has_more_commands:
+            parser.advance()
+            if parser.command_type == 'L_COMMAND':
+                labels.append([parser.symbol, len(sources)])
+            else:
+                sources.append(parser.instruction)
+        cached_sources = entry['sources']
+        if labels != entry['labels'] or len(sources) != len(cached_sources):
+            return False
+        changed = [index for index, source in enumerate(sources)
+            if source != cached_sources[index]]
+        label_names = set(label for label, address in labels)
+        for index in changed:
+            if (self.names_variable(sources[index], label_names) or
+                    self.names_variable(cached_sources[index], label_names)):
+                return False
+        start = self.record_time('parse', start)
+
+        for label, address in labels:
+            self.symbol_table.add_entry(label, address)
+        for symbol in entry['variables']:
+            self.add_variable(symbol)
+        words = array('H', entry['words'])
+        for index in changed:
+            if sources[index][0] == '@':
+                words[index] = self.get_address(sources[index][1:])
+            else:
+                words[index] = self.code.encode(sources[index])
+        self.words = words
+        self.record_time('re-encode {} instructions'.format(len(changed)), start)
+        return True
+
+    def names_variable(self, source, label_names):
+        symbol = source[1:]
+        return (source[0] == '@' and not self.is_constant(symbol)
+            and symbol not in label_names
+            and not self.symbol_table.contains(symbol))
 
-    def assemble(self, asm_filename):
-        self.prepare_files(asm_filename)
+    def get_address(self, symbol):
+        if self.is_constant(symbol):
+            return self.create_address(symbol)
+        return self.symbol_table.get_address(symbol)
+
+    def assemble_two_pass(self):
         parser = self.parser
 
         # First pass to build label table
+        start = time.time()
         while parser.has_more_commands:
             parser.advance()
             if parser.command_type == 'L_COMMAND':
                 self.write_L(parser.symbol)
+        start = self.record_time('first pass', start)
 
-        # Second pass to write .hack file
+        # Second pass to encode instructions
         parser.reset_file()
-        self.ram_address = 16
         while parser.has_more_commands:
             parser.advance()
             if parser.command_type == 'A_COMMAND':
                 self.write_A(parser.symbol)
             elif parser.command_type == 'C_COMMAND':
-                self.write_C(parser.dest, parser.comp, parser.jump)
+                self.write_C(parser.mnemonic)
+        self.record_time('second pass', start)
+        start = time.time()
+        self.write_output()
+        self.record_time('write', start)
+
+    def assemble_single_pass(self):
+        '''Read the file once into a list of instructions.
+
+        A-instructions naming a symbol that is not yet in the table are
+        left as 0 and recorded, then backpatched once every label is
+        known. Remaining symbols are variables, allocated in order of
+        first use, exactly as the second pass would allocate them.
+        '''
+        parser = self.parser
+        words = self.words
+        sources = self.sources
+        references = [] # (instruction index, symbol) to backpatch
+
+        start = time.time()
+        while parser.has_more_commands:
+            parser.advance()
+            if parser.command_type != 'L_COMMAND':
+                sources.append(parser.instruction)
+            if parser.command_type == 'A_COMMAND':
+                symbol = parser.symbol
+                if self.is_constant(symbol):
+                    words.append(self.create_address(symbol))
+                elif self.symbol_table.contains(symbol):
+                    words.append(self.symbol_table.get_address(symbol))
+                else:
+                    references.append((len(words), symbol))
+                    words.append(0)
+            elif parser.command_type == 'C_COMMAND':
+                words.append(self.code.encode(parser.mnemonic))
+            elif parser.command_type == 'L_COMMAND':
+                self.write_L(parser.symbol)
+        start = self.record_time('parse', start)
+
+        for index, symbol in references:
+            if not self.symbol_table.contains(symbol): # Variable
+                self.add_variable(symbol)
+            words[index] = self.symbol_table.get_address(symbol)
+        start = self.record_time('backpatch', start)
+
+        self.write_output()
+        self.record_time('write', start)
 
-        parser.close_asm()
-        self.hack.close()
+    def record_time(self, phase, start):
+        '''Record time elapsed since start, return the new start time'''
+        now = time.time()
+        self.timings.append((phase, now - start))
+        return now
 
-    def prepare_files(self, asm_filename):
+    def prepare_files(self, asm_filename, binary=False):
         assert '.asm' in asm_filename, 'Must pass .asm file!'
         self.parser.load_file(asm_filename)
-        hack_filename = asm_filename.replace('.asm', '.hack')
-        self.hack = open(hack_filename, 'w')
+        self.binary = binary
+        extension = '.rom' if binary else '.hack'
+        self.out_filename = asm_filename.replace('.asm', extension)
 
     def create_address(self, symbol):
-        address = '{0:b}'.format(int(symbol))
-        base = (15 - len(address)) * '0'
-        return base + address
+        return int(symbol)
 
     def write(self, instruction):
-        self.hack.write(instruction + '\n')
+        self.words.append(instruction)
+
+    def symbol_index(self):
+        '''Index of the labels and variables of the last assembly'''
+        variables = [(symbol, symbols.RAM_BASE + index) # Allocated in order
+            for index, symbol in enumerate(self.variables)]
+        return symbols.SymbolIndex(self.labels, variables)
+
+    def write_symbols(self, sym_filename):
+        symbols.write_symbols(sym_filename, self.symbol_index())
+
+    def write_output(self):
+        if not self.output:
+            return
+        if self.binary:
+            rom.write_rom(self.out_filename, self.words)
+        else:
+            rom.write_hack(self.out_filename, self.words)
 
-    def write_A(self, symbol):
-        instruction = '0'
+    def is_constant(self, symbol):
         try:
             int(symbol)
         except ValueError:
-            if not self.symbol_table.contains(symbol): # Build table on first pass
-                address = self.create_address(self.ram_address)
-                self.symbol_table.add_entry(symbol, address)
-                self.ram_address += 1
-            instruction += self.symbol_table.get_address(symbol)
+            return False
+        return True
+
+    def add_variable(self, symbol):
+        address = self.create_address(self.ram_address)
+        self.symbol_table.add_entry(symbol, address)
+        self.variables.append(symbol)
+        self.ram_address += 1
+
+    def write_A(self, symbol):
+        if self.is_constant(symbol):
+            instruction = self.create_address(symbol)
         else:
-            instruction += self.create_address(symbol)
+            if not self.symbol_table.contains(symbol): # Build table on first pass
+                self.add_variable(symbol)
+            instruction = self.symbol_table.get_address(symbol)
 
         self.write(instruction)
 
     def write_L(self, symbol):
+        if self.symbol_table.contains(symbol):
+            raise ValueError('line {}: {} is already defined'.format(
+                self.parser.line_num, symbol))
         address = self.create_address(self.parser.instruction_num+1)
         self.symbol_table.add_entry(symbol, address)
+        self.labels.append([symbol, address])
+
+    def write_C(self, mnemonic):
+        self.write(self.code.encode(mnemonic))
+
+class AssemblyCache(object):
+    '''The last assembly of one .asm file, stored as JSON in CACHE_DIR
+    beside the source and keyed by a hash of the source text and VERSION.
+    A hash of each output file written (.hack, .rom) is kept too, so an
+    output that went missing or was changed is written again.
+    '''
+    def __init__(self, asm_filename):
+        dirname, basename = os.path.split(asm_filename)
+        self.cache_filename = os.path.join(dirname, CACHE_DIR, basename + '.json')
+        with open(asm_filename, 'rb') as asm:
+            self.key = hashlib.sha1(VERSION.encode() + asm.read()).hexdigest()
+        self.entry = self.load()
+
+    @property
+    def hit(self):
+        return self.entry is not None and self.entry['key'] == self.key
+
+    def load(self):
+        try:
+            with open(self.cache_filename, 'r') as f:
+                entry = json.load(f)
+        except (IOError, ValueError): # Missing or corrupt
+            return None
+        if entry.get('version') != VERSION:
+            return None
+        return entry
+
+    def output_matches(self, out_filename):
+        '''True if out_filename is as this entry last wrote it'''
+        extension = os.path.splitext(out_filename)[1]
+        written = self.hash_file(out_filename)
+        return written is not None and written == self.entry.get('outputs', {}).get(extension)
+
+    def hash_file(self, filename):
+        try:
+            with open(filename, 'rb') as f:
+                return hashlib.sha1(f.read()).hexdigest()
+        except IOError: # Missing
+            return None
+
+    def save(self, assembler):
+        try:
+            os.makedirs(os.path.dirname(self.cache_filename))
+        except OSError: # Already exists
+            pass
+        outputs = {}
+        if self.entry is not None and self.entry['key'] == self.key:
+            outputs = self.entry.get('outputs', {}) # Other formats still match
+        if assembler.output:
+            extension = os.path.splitext(assembler.out_filename)[1]
+            outputs[extension] = self.hash_file(assembler.out_filename)
+        entry = {
+            'version': VERSION,
+            'key': self.key,
+            'sources': assembler.sources,
+            'labels': assembler.labels,
+            'variables': assembler.variables,
+            'words': assembler.words.tolist(),
+            'outputs': outputs,
+        }
+        with open(self.cache_filename, 'w') as f:
+            json.dump(entry, f)
+        self.entry = entry
+
+
+class LineBuffer(object):
+    '''The part of the file interface Parser uses, over a list of lines'''
+    def __init__(self, lines):
+        self.lines = [line or '\n' for line in lines] # '' means end of file
+        self.position = 0
+
+    def readline(self):
+        if self.position == len(self.lines):
+            return ''
+        self.position += 1
+        return self.lines[self.position - 1]
+
+    def seek(self, position):
+        self.position = position
+
+    def close(self):
+        self.lines = []
 
-    def write_C(self, dest, comp, jump):
-        instruction = '111'
-        instruction += self.code.comp(comp)
-        instruction += self.code.dest(dest)
-        instruction += self.code.jump(jump)
-        self.write(instruction)
 
 class Parser(object):
     def load_file(self, asm_filename):
-        self.asm = open(asm_filename, 'r')
+        self.load(open(asm_filename, 'r'))
+
+    def load_lines(self, lines):
+        self.load(LineBuffer(lines))
+
+    def load(self, asm):
+        self.asm = asm
         self.reset_file()
         self.symbol = None
-        self.dest = None
-        self.comp = None
-        self.jump = None
+        self.mnemonic = None
         self.command_type = None
 
     def reset_file(self):
         self.asm.seek(0)
-        line = self.asm.readline().strip()
-        while self.is_not_instruction(line):
-            line = self.asm.readline().strip()
-        self.curr_instruction = line
+        self.curr_line_num = 0
+        self.get_next_instruction()
         self.instruction_num = -1 # 0 once first instruction is parsed.
 
     def close_asm(self):
         self.asm.close()
 
-    def is_not_instruction(self, line):
-        return not line or line[:2] == '//'
-
     @property
     def has_more_commands(self):
         return bool(self.curr_instruction)
 
     def get_next_instruction(self):
-        line = self.asm.readline().strip()
-        line = line.split('//')[0]
-        line = line.strip()
-        self.curr_instruction = line
+        '''Skip blank and comment lines; empty at end of file'''
+        line = self.asm.readline()
+        while line:
+            self.curr_line_num += 1
+            instruction = line.split('//')[0].strip()
+            if instruction:
+                self.curr_instruction = instruction
+                return
+            line = self.asm.readline()
+        self.curr_instruction = ''
 
     def advance(self):
         '''Parse current instruction and load next instruction
         '''
-        ci = self.curr_instruction
+        ci = self.instruction = self.curr_instruction
+        self.line_num = self.curr_line_num
         if ci[0] == '@':
             self.parse_A(ci)
             self.instruction_num += 1
@@ -143,77 +451,122 @@ class Parser(object):
 
     def parse_C(self, instruction):
         '''C instruction format: dest=comp;jump
+
+        Code.encode takes the whole mnemonic, so the fields are only split
+        out on request.
         '''
-        self.dest, self.comp, self.jump = None, None, None
-        parts = instruction.split(';')
-        remainder = parts[0]
-        if len(parts) == 2:
-            self.jump = parts[1]
-        parts = remainder.split('=')
-        if len(parts) == 2:
-            self.dest = parts[0]
-            self.comp = parts[1]
-        else:
-            self.comp = parts[0]
+        self.mnemonic = instruction
         self.command_type = 'C_COMMAND'
 
+    @property
+    def dest(self):
+        if '=' in self.mnemonic:
+            return self.mnemonic.split('=')[0]
+        return None
+
+    @property
+    def comp(self):
+        return self.mnemonic.split('=')[-1].split(';')[0]
+
+    @property
+    def jump(self):
+        if ';' in self.mnemonic:
+            return self.mnemonic.split(';')[1]
+        return None
+
 
 class Code(object):
-    def dest(self, mnemonic):
-        '''Alt: Enumerate all possibilities and do dictionary lookup.
-        Current implemention is more flexible,
-            but slower (max 9 comparisons vs 1 hashing)
+    def __init__(self):
+        self.dests = self.dest_dict()
+        self.comps = self.comp_dict()
+        self.jumps = self.jump_dict()
+        self.instructions = self.instruction_table()
+
+    def encode(self, mnemonic):
+        '''Full 16-bit word for a C-instruction, e.g. 'AM=M+1;JMP'
         '''
-        bin = ['0', '0', '0']
-        if mnemonic is None:
-            return ''.join(bin)
-        if 'A' in mnemonic:
-            bin[0] = '1'
-        if 'D' in mnemonic:
-            bin[1] = '1'
-        if 'M' in mnemonic:
-            bin[2] = '1'
-        return ''.join(bin)
+        word = self.instructions.get(mnemonic)
+        if word is None:
+            self.raise_unknown(mnemonic)
+        return word
+
+    def dest(self, mnemonic):
+        return self.lookup(self.dests, mnemonic)
 
     def comp(self, mnemonic):
-        comp_dict = {
-              '0': '101010',
-              '1': '111111',
-             '-1': '111010',
-              'D': '001100',
-              'A': '110000',
-             '!D': '001101',
-             '!A': '110001',
-             '-D': '001111',
-             '-A': '110011',
-            'D+1': '011111',
-            'A+1': '110111',
-            'D-1': '001110',
-            'A-1': '110010',
-            'D+A': '000010',
-            'D-A': '010011',
-            'A-D': '000111',
-            'D&A': '000000',
-            'D|A': '010101',
-        }
-        a_bit = '0'
-        if 'M' in mnemonic:
-            a_bit = '1'
-            mnemonic = mnemonic.replace('M', 'A')
-        c_bit = comp_dict.get(mnemonic, '000000')
-        return a_bit + c_bit
+        return self.lookup(self.comps, mnemonic)
 
     def jump(self, mnemonic):
-        jump_dict = {
-            'JGT': '001',
-            'JEQ': '010',
-            'JGE': '011',
-            'JLT': '100',
-            'JNE': '101',
-            'JLE': '110',
-            'JMP': '111',
+        return self.lookup(self.jumps, mnemonic)
+
+    def lookup(self, table, mnemonic):
+        if mnemonic not in table:
+            self.raise_unknown(mnemonic)
+        return table[mnemonic]
+
+    def raise_unknown(self, mnemonic):
+        raise ValueError('{} is an invalid instruction'.format(mnemonic))
+
+    def instruction_table(self):
+        '''Every legal dest=comp;jump spelling, mapped to its word'''
+        table = {}
+        for dest, dest_bits in self.dests.items():
+            dest = dest + '=' if dest else ''
+            for comp, comp_bits in self.comps.items():
+                for jump, jump_bits in self.jumps.items():
+                    jump = ';' + jump if jump else ''
+                    word = C_PREFIX | comp_bits << 6 | dest_bits << 3 | jump_bits
+                    table[dest + comp + jump] = word
+        return table
+
+    def dest_dict(self):
+        '''Any ordering of the destination registers, e.g. MD or DM'''
+        bits = {'A': 0b100, 'D': 0b010, 'M': 0b001}
+        dests = {None: 0b000}
+        for length in range(1, 4):
+            for registers in permutations('ADM', length):
+                dests[''.join(registers)] = sum(bits[r] for r in registers)
+        return dests
+
+    def comp_dict(self):
+        comps = {
+              '0': 0b101010,
+              '1': 0b111111,
+             '-1': 0b111010,
+              'D': 0b001100,
+              'A': 0b110000,
+             '!D': 0b001101,
+             '!A': 0b110001,
+             '-D': 0b001111,
+             '-A': 0b110011,
+            'D+1': 0b011111,
+            'A+1': 0b110111,
+            'D-1': 0b001110,
+            'A-1': 0b110010,
+            'D+A': 0b000010,
+            'D-A': 0b010011,
+            'A-D': 0b000111,
+            'D&A': 0b000000,
+            'D|A': 0b010101,
+        }
+        for mnemonic in ['D+A', 'D&A', 'D|A']: # Commutative spellings
+            comps[mnemonic[::-1]] = comps[mnemonic]
+        for mnemonic, bits in list(comps.items()):
+            if 'A' in mnemonic: # a-bit selects M in place of A
+                comps[mnemonic.replace('A', 'M')] = 1 << 6 | bits
+        return comps
+
+    def jump_dict(self):
+        return {
+             None: 0b000,
+            'JGT': 0b001,
+            'JEQ': 0b010,
+            'JGE': 0b011,
+            'JLT': 0b100,
+            'JNE': 0b101,
+            'JLE': 0b110,
+            'JMP': 0b111,
         }
-        return jump_dict.get(mnemonic, '000')
 
 
 class SymbolTable(object):
@@ -232,35 +585,128 @@ class SymbolTable(object):
 
     def base_table(self): # 15 bit addresses, 32K locations
         return {
-             'SP': '000000000000000',
-            'LCL': '000000000000001',
-            'ARG': '000000000000010',
-           'THIS': '000000000000011',
-           'THAT': '000000000000100',
-             'R0': '000000000000000',
-             'R1': '000000000000001',
-             'R2': '000000000000010',
-             'R3': '000000000000011',
-             'R4': '000000000000100',
-             'R5': '000000000000101',
-             'R6': '000000000000110',
-             'R7': '000000000000111',
-             'R8': '000000000001000',
-             'R9': '000000000001001',
-            'R10': '000000000001010',
-            'R11': '000000000001011',
-            'R12': '000000000001100',
-            'R13': '000000000001101',
-            'R14': '000000000001110',
-            'R15': '000000000001111',
-         'SCREEN': '100000000000000',
-            'KBD': '110000000000000',
+             'SP': 0,
+            'LCL': 1,
+            'ARG': 2,
+           'THIS': 3,
+           'THAT': 4,
+             'R0': 0,
+             'R1': 1,
+             'R2': 2,
+             'R3': 3,
+             'R4': 4,
+             'R5': 5,
+             'R6': 6,
+             'R7': 7,
+             'R8': 8,
+             'R9': 9,
+            'R10': 10,
+            'R11': 11,
+            'R12': 12,
+            'R13': 13,
+            'R14': 14,
+            'R15': 15,
+         'SCREEN': 16384,
+            'KBD': 24576,
         }
 
 
+def assemble_file(asm_filename, single_pass=False, binary=False, cache=False,
+        sym_file=False):
+    '''Assemble one file with fresh tables; safe to run in a worker process.
+
+    Returns (asm_filename, seconds, timings, error), where error is None
+    on success. Exceptions are caught so one bad file can't sink a batch.
+    '''
+    start = time.time()
+    assembler = Assembler(Parser(), SymbolTable(), Code())
+    try:
+        assembler.assemble(asm_filename, single_pass=single_pass,
+            binary=binary, cache=cache, sym_file=sym_file)
+    except Exception as e:
+        error = '{}: {}'.format(type(e).__name__, e)
+        return asm_filename, time.time() - start, assembler.timings, error
+    return asm_filename, time.time() - start, assembler.timings, None
+
+def find_asm_files(paths):
+    '''Expand files, directories (searched recursively) and glob patterns.
+
+    A directory or pattern that matches no .asm files is an error.
+    '''
+    asm_files = []
+    for path in paths:
+        if os.path.isdir(path):
+            found = [os.path.join(dirpath, filename)
+                for dirpath, dirnames, filenames in sorted(os.walk(path))
+                for filename in sorted(filenames) if filename.endswith('.asm')]
+        elif glob.has_magic(path):
+            found = sorted(filename for filename in glob.glob(path)
+                if filename.endswith('.asm'))
+        else:
+            found = [path] # Missing files are reported as failures
+        if not found:
+            raise ValueError('{} matches no .asm files'.format(path))
+        asm_files.extend(found)
+    return asm_files
+
+def assemble_all(asm_files, jobs=1, **options):
+    '''Assemble independent files across a process pool.
+
+    Yields the results of assemble_file in input order.
+    '''
+    assemble = partial(assemble_file, **options)
+    if jobs == 1 or len(asm_files) <= 1: # Not worth starting a pool
+        for asm_file in asm_files:
+            yield assemble(asm_file)
+        return
+    pool = Pool(jobs)
+    try:
+        for result in pool.imap(assemble, asm_files):
+            yield result
+    finally:
+        pool.close()
+        pool.join()
+
+
 if __name__ == '__main__':
+    import argparse
     import sys
 
-    asm_filename = sys.argv[1]
-    assembler = Assembler(Parser(), SymbolTable(), Code())
-    assembler.assemble(asm_filename)
+    arg_parser = argparse.ArgumentParser(description='Hack Assembler')
+    arg_parser.add_argument('paths', nargs='+',
+        help='.asm files, directories or glob patterns')
+    arg_parser.add_argument('--single-pass', action='store_true',
+        help='read each .asm file once and backpatch forward labels')
+    arg_parser.add_argument('--binary', action='store_true',
+        help='write a packed 16-bit .rom image instead of .hack text')
+    arg_parser.add_argument('--cache', action='store_true',
+        help='skip unchanged files and re-encode only edited instructions')
+    arg_parser.add_argument('--symbols', action='store_true',
+        help='also write a .sym file of label and variable addresses')
+    arg_parser.add_argument('--timing', action='store_true',
+        help='report time spent in each phase')
+    arg_parser.add_argument('-j', '--jobs', type=int, default=1,
+        help='worker processes, 0 for one per core (default: 1)')
+    args = arg_parser.parse_args()
+
+    start = time.time()
+    try:
+        asm_files = find_asm_files(args.paths)
+    except ValueError as e:
+        arg_parser.error(str(e))
+    results = assemble_all(asm_files, jobs=args.jobs or None,
+        single_pass=args.single_pass, binary=args.binary, cache=args.cache,
+        sym_file=args.symbols)
+    failures = 0
+    for asm_filename, seconds, timings, error in results:
+        if error:
+            failures += 1
+            print('{}: FAILED ({})'.format(asm_filename, error))
+            continue
+        print('{}: {:.4f}s'.format(asm_filename, seconds))
+        if args.timing:
+            for phase, phase_seconds in timings:
+                print('  {}: {:.4f}s'.format(phase, phase_seconds))
+    print('Assembled {} of {} files in {:.4f}s'.format(
+        len(asm_files) - failures, len(asm_files), time.time() - start))
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,485 @@
+#!/usr/bin/env python
+'''
+Hack CPU Emulator
+
+Runs Hack machine code without the Java CPUEmulator. Each ROM word is
+decoded once, up front, into an opcode and an operand, so the run loop
+only dispatches. The instructions that dominate VM translator output
+(@value, D=M, A=M, M=D, M=M+1, ...) have their own opcodes and are
+executed inline; everything else is GENERIC, with a tuple of (comp
+function, reads M, dest bits, jump bits) as its operand. RAM is an
+array('h') of 32K signed 16-bit words.
+
+Runs until a cycle limit, the end of the program, or a halt loop:
+    (END)
+    @END
+    0;JMP
+
+BlockEmulator (--jit) goes further: the first time execution reaches an
+address, the straight-line run of instructions from there up to and
+including the next jump is turned into Python source, compiled, and
+cached by start address. Indirect jumps (A=M, 0;JMP) just end a block;
+the next block is looked up by the pc it returns. Hack ROM can't be
+written, so compiled blocks never go stale. Halt loops and blocks that
+would overrun the cycle limit are left to the interpreter.
+'''
+
+from __future__ import print_function
+
+import json
+import time
+from array import array
+
+import rom
+from assembler import Assembler, Parser, SymbolTable, Code
+from symbols import read_symbols
+
+RAM_SIZE = 32768 # Also makes negative addresses wrap like 15-bit ones
+
+# Opcodes, in the order the run loop tests them
+(A_INSTRUCTION, D_EQ_M, A_EQ_M, M_EQ_D, M_INC, M_DEC,
+    D_SUB_A, A_EQ_D, D_EQ_A, JMP, GENERIC) = range(11)
+
+WRAP = '({} + 32768 & 0xFFFF) - 32768'
+
+
+def wrap(value):
+    '''Two's complement overflow to 16 bits'''
+    return (value + 32768 & 0xFFFF) - 32768
+
+
+class Emulator(object):
+    def __init__(self, words):
+        self.rom = array('H', words)
+        self.comps = self.comp_dict()
+        self.opcodes, self.operands = self.decode(self.rom)
+        self.reset()
+
+    def reset(self):
+        self.ram = array('h', [0]) * RAM_SIZE
+        self.a = 0
+        self.d = 0
+        self.pc = 0
+        self.cycles = 0
+        self.halted = False
+
+    def decode(self, words):
+        '''Return parallel lists of opcodes and operands, one per word'''
+        fast = self.fast_dict()
+        opcodes, operands = [], []
+        for word in words:
+            if not word & 0x8000:
+                opcodes.append(A_INSTRUCTION)
+                operands.append(word)
+            elif word in fast:
+                opcodes.append(fast[word])
+                operands.append(None)
+            else:
+                comp = (word >> 6) & 0b1111111
+                if comp not in self.comps:
+                    raise ValueError('{:016b} is an invalid instruction'.format(word))
+                opcodes.append(GENERIC)
+                operands.append((self.comps[comp], comp >> 6,
+                    (word >> 3) & 0b111, word & 0b111))
+        return opcodes, operands
+
+    def is_halt(self, target, pc):
+        '''True for a jump back to the @-instruction that loaded its own address'''
+        return (target == pc - 1 and self.opcodes[target] == A_INSTRUCTION
+            and self.operands[target] == target)
+
+    def run(self, max_cycles):
+        '''Execute up to max_cycles instructions; return the number run'''
+        if self.halted:
+            return 0
+        opcodes, operands = self.opcodes, self.operands
+        ram = self.ram
+        a, d, pc = self.a, self.d, self.pc
+        end = len(opcodes)
+        cycles = 0
+        while cycles < max_cycles:
+            if pc >= end:
+                self.halted = True
+                break
+            opcode = opcodes[pc]
+            cycles += 1
+            if opcode == A_INSTRUCTION:
+                a = operands[pc]
+            elif opcode == D_EQ_M:
+                d = ram[a]
+            elif opcode == A_EQ_M:
+                a = ram[a]
+            elif opcode == M_EQ_D:
+                ram[a] = d
+            elif opcode == M_INC:
+                m = ram[a] + 1
+                ram[a] = m if m != 32768 else -32768
+            elif opcode == M_DEC:
+                m = ram[a] - 1
+                ram[a] = m if m != -32769 else 32767
+            elif opcode == D_SUB_A:
+                d = wrap(d - a)
+            elif opcode == A_EQ_D:
+                a = d
+            elif opcode == D_EQ_A:
+                d = a
+            elif opcode == JMP:
+                target = a & 0x7FFF
+                if self.is_halt(target, pc):
+                    self.halted = True
+                    break
+                pc = target
+                continue
+            else:
+                comp, reads_m, dest, jump = operands[pc]
+                address = a
+                out = comp(d, a, ram[address] if reads_m else 0)
+                if dest:
+                    if dest & 0b001:
+                        ram[address] = out
+                    if dest & 0b010:
+                        d = out
+                    if dest & 0b100:
+                        a = out
+                if jump and (jump == 0b111 or (jump & 0b100 and out < 0)
+                        or (jump & 0b010 and out == 0) or (jump & 0b001 and out > 0)):
+                    target = address & 0x7FFF
+                    if jump == 0b111 and self.is_halt(target, pc):
+                        self.halted = True
+                        break
+                    pc = target
+                    continue
+            pc += 1
+        self.a, self.d, self.pc = a, d, pc
+        self.cycles += cycles
+        return cycles
+
+    def fast_dict(self):
+        '''Instruction word -> opcode for the instructions run inline'''
+        code = Code()
+        return {
+            code.encode('D=M'): D_EQ_M,
+            code.encode('A=M'): A_EQ_M,
+            code.encode('M=D'): M_EQ_D,
+            code.encode('M=M+1'): M_INC,
+            code.encode('M=M-1'): M_DEC,
+            code.encode('D=D-A'): D_SUB_A,
+            code.encode('A=D'): A_EQ_D,
+            code.encode('D=A'): D_EQ_A,
+            code.encode('0;JMP'): JMP,
+        }
+
+    def comp_dict(self):
+        '''a-bit + c-bits -> f(D, A, M)'''
+        return {
+            0b0101010: lambda d, a, m: 0,
+            0b0111111: lambda d, a, m: 1,
+            0b0111010: lambda d, a, m: -1,
+            0b0001100: lambda d, a, m: d,
+            0b0110000: lambda d, a, m: a,
+            0b1110000: lambda d, a, m: m,
+            0b0001101: lambda d, a, m: ~d,
+            0b0110001: lambda d, a, m: ~a,
+            0b1110001: lambda d, a, m: ~m,
+            0b0001111: lambda d, a, m: wrap(-d),
+            0b0110011: lambda d, a, m: wrap(-a),
+            0b1110011: lambda d, a, m: wrap(-m),
+            0b0011111: lambda d, a, m: wrap(d + 1),
+            0b0110111: lambda d, a, m: wrap(a + 1),
+            0b1110111: lambda d, a, m: wrap(m + 1),
+            0b0001110: lambda d, a, m: wrap(d - 1),
+            0b0110010: lambda d, a, m: wrap(a - 1),
+            0b1110010: lambda d, a, m: wrap(m - 1),
+            0b0000010: lambda d, a, m: wrap(d + a),
+            0b1000010: lambda d, a, m: wrap(d + m),
+            0b0010011: lambda d, a, m: wrap(d - a),
+            0b1010011: lambda d, a, m: wrap(d - m),
+            0b0000111: lambda d, a, m: wrap(a - d),
+            0b1000111: lambda d, a, m: wrap(m - d),
+            0b0000000: lambda d, a, m: d & a,
+            0b1000000: lambda d, a, m: d & m,
+            0b0010101: lambda d, a, m: d | a,
+            0b1010101: lambda d, a, m: d | m,
+        }
+
+
+class BlockEmulator(Emulator):
+    def __init__(self, words):
+        Emulator.__init__(self, words)
+        self.comp_sources = self.comp_source_dict()
+        self.blocks = {}
+
+    def run(self, max_cycles):
+        '''Execute up to max_cycles instructions; return the number run'''
+        if self.halted:
+            return 0
+        blocks = self.blocks
+        ram = self.ram
+        a, d, pc = self.a, self.d, self.pc
+        end = len(self.rom)
+        cycles = 0
+        while pc < end:
+            block = blocks.get(pc)
+            if block is None:
+                block = blocks[pc] = self.compile_block(pc)
+            function, length = block
+            if function is None or cycles + length > max_cycles:
+                break
+            a, d, pc = function(ram, a, d)
+            cycles += length
+        self.a, self.d, self.pc = a, d, pc
+        self.cycles += cycles
+        return cycles + Emulator.run(self, max_cycles - cycles)
+
+    def compile_block(self, start):
+        '''Return (function, length) for the block at start; None for a halt loop'''
+        if self.is_halt_loop(start):
+            return None, 0
+        lines, pc = self.block_source(start)
+        source = 'def block(ram, a, d):\n    ' + '\n    '.join(lines) + '\n'
+        namespace = {}
+        exec(compile(source, '<block {}>'.format(start), 'exec'), namespace)
+        return namespace['block'], pc - start
+
+    def block_source(self, start):
+        '''Python statements for the block at start, and the address after it'''
+        lines = []
+        known = None # Value of A, while it's a constant
+        pc = start
+        while pc < len(self.rom):
+            if pc > start and self.is_halt_loop(pc):
+                break
+            word = self.rom[pc]
+            pc += 1
+            if not word & 0x8000:
+                known = word
+                lines.append('a = {}'.format(word))
+                continue
+
+            comp = (word >> 6) & 0b1111111
+            dest, jump = (word >> 3) & 0b111, word & 0b111
+            a = 'a' if known is None else str(known)
+            expression = self.comp_sources[comp].format(d='d', a=a, m='ram[{}]'.format(a))
+            if dest & 0b100:
+                known = None
+            targets = [name for bit, name in ((0b001, 'ram[{}]'.format(a)),
+                (0b010, 'd'), (0b100, 'a')) if dest & bit]
+            if not jump:
+                if len(targets) == 1:
+                    lines.append('{} = {}'.format(targets[0], expression))
+                elif targets:
+                    lines.append('out = {}'.format(expression))
+                    lines.extend('{} = out'.format(target) for target in targets)
+                continue
+
+            lines.append('target = {} & 0x7FFF'.format(a))
+            lines.append('out = {}'.format(expression))
+            lines.extend('{} = out'.format(target) for target in targets)
+            if jump == 0b111:
+                lines.append('return a, d, target')
+            else:
+                lines.append('return a, d, target if {} else {}'.format(
+                    self.conditions[jump].format('out'), pc))
+            return lines, pc
+
+        lines.append('return a, d, {}'.format(pc))
+        return lines, pc
+
+    def is_halt_loop(self, address):
+        '''True if address starts an @address, 0;JMP loop'''
+        return (address + 1 < len(self.rom) and self.opcodes[address + 1] == JMP
+            and self.is_halt(address, address + 1))
+
+    conditions = {
+        0b001: '{} > 0',
+        0b010: '{} == 0',
+        0b011: '{} >= 0',
+        0b100: '{} < 0',
+        0b101: '{} != 0',
+        0b110: '{} <= 0',
+    }
+
+    def comp_source_dict(self):
+        '''a-bit + c-bits -> Python expression in {d}, {a} and {m}'''
+        return {
+            0b0101010: '0',
+            0b0111111: '1',
+            0b0111010: '-1',
+            0b0001100: '{d}',
+            0b0110000: '{a}',
+            0b1110000: '{m}',
+            0b0001101: '~{d}',
+            0b0110001: '~{a}',
+            0b1110001: '~{m}',
+            0b0001111: WRAP.format('-{d}'),
+            0b0110011: WRAP.format('-{a}'),
+            0b1110011: WRAP.format('-{m}'),
+            0b0011111: WRAP.format('{d} + 1'),
+            0b0110111: WRAP.format('{a} + 1'),
+            0b1110111: WRAP.format('{m} + 1'),
+            0b0001110: WRAP.format('{d} - 1'),
+            0b0110010: WRAP.format('{a} - 1'),
+            0b1110010: WRAP.format('{m} - 1'),
+            0b0000010: WRAP.format('{d} + {a}'),
+            0b1000010: WRAP.format('{d} + {m}'),
+            0b0010011: WRAP.format('{d} - {a}'),
+            0b1010011: WRAP.format('{d} - {m}'),
+            0b0000111: WRAP.format('{a} - {d}'),
+            0b1000111: WRAP.format('{m} - {d}'),
+            0b0000000: '{d} & {a}',
+            0b1000000: '{d} & {m}',
+            0b0010101: '{d} | {a}',
+            0b1010101: '{d} | {m}',
+        }
+
+
+class Profiler(BlockEmulator):
+    '''BlockEmulator that counts how many times each ROM address runs.
+
+    Every instruction of a block runs each time the block does, so only
+    block runs are counted in the loop. What is left to the interpreter
+    (halt loops, a block that would overrun the cycle limit) is stepped
+    and counted one instruction at a time.
+    '''
+    def __init__(self, words):
+        BlockEmulator.__init__(self, words)
+        self.block_runs = {} # Start address: times run
+        self.steps = [0] * len(self.rom) # Times run by the interpreter
+
+    def run(self, max_cycles):
+        '''Execute up to max_cycles instructions; return the number run'''
+        if self.halted:
+            return 0
+        blocks = self.blocks
+        block_runs = self.block_runs
+        ram = self.ram
+        a, d, pc = self.a, self.d, self.pc
+        end = len(self.rom)
+        cycles = 0
+        while pc < end:
+            block = blocks.get(pc)
+            if block is None:
+                block = blocks[pc] = self.compile_block(pc)
+            function, length = block
+            if function is None or cycles + length > max_cycles:
+                break
+            block_runs[pc] = block_runs.get(pc, 0) + 1
+            a, d, pc = function(ram, a, d)
+            cycles += length
+        self.a, self.d, self.pc = a, d, pc
+        self.cycles += cycles
+        while cycles < max_cycles:
+            pc = self.pc
+            if not Emulator.run(self, 1):
+                break
+            self.steps[pc] += 1
+            cycles += 1
+        return cycles
+
+    def counts(self):
+        '''Times each ROM address has run so far'''
+        counts = list(self.steps)
+        for start, runs in self.block_runs.items():
+            for address in range(start, start + self.blocks[start][1]):
+                counts[address] += runs
+        return counts
+
+
+def hot_spots(counts, source_map, top=20):
+    '''Report lines: cycles per VM function, then per VM command.
+
+    source_map is as VMtranslator --map writes it: the (file, function,
+    command number, VM text) of each command, and the index of a command
+    for each ROM address.
+    '''
+    sources, addresses = source_map['sources'], source_map['addresses']
+    total = sum(counts)
+    by_command = {}
+    for address, count in enumerate(counts):
+        if count:
+            source = addresses[address] if address < len(addresses) else None
+            by_command[source] = by_command.get(source, 0) + count
+    by_function = {}
+    for source, count in by_command.items():
+        function = describe_function(sources[source]) if source is not None else '(unmapped)'
+        by_function[function] = by_function.get(function, 0) + count
+
+    lines = ['{:>10} {:>6}  Function'.format('Cycles', '%')]
+    for function, count in sorted(by_function.items(), key=lambda item: -item[1])[:top]:
+        lines.append('{:>10} {:>5.1f}%  {}'.format(count, 100.0 * count / total, function))
+    lines.append('')
+    lines.append('{:>10} {:>6}  VM command'.format('Cycles', '%'))
+    for source, count in sorted(by_command.items(), key=lambda item: -item[1])[:top]:
+        if source is None:
+            where, text = '(unmapped)', ''
+        else:
+            filename, function, number, text = sources[source]
+            where = '{}:{}'.format(filename, number)
+        lines.append('{:>10} {:>5.1f}%  {:<20} {}'.format(
+            count, 100.0 * count / total, where, text))
+    return lines
+
+def describe_function(source):
+    filename, function, number, text = source
+    return function or '({})'.format(filename or text)
+
+
+def load_program(filename):
+    '''ROM words from a .hack file, .rom image, or .asm (assembled first)'''
+    if filename.endswith('.hack'):
+        return rom.read_hack(filename)
+    if filename.endswith('.rom'):
+        with rom.load_rom(filename) as image:
+            return image.words()
+    if filename.endswith('.asm'):
+        assembler = Assembler(Parser(), SymbolTable(), Code())
+        assembler.assemble(filename, output=False)
+        return assembler.words
+    raise ValueError('{} is not a .hack, .rom or .asm file'.format(filename))
+
+
+if __name__ == '__main__':
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(description='Hack CPU Emulator')
+    arg_parser.add_argument('program', help='.hack, .rom or .asm file')
+    arg_parser.add_argument('--max-cycles', type=int, default=10 ** 7,
+        help='stop after this many instructions (default: 10M)')
+    arg_parser.add_argument('--set', nargs='*', default=[], metavar='ADDRESS=VALUE',
+        help='initial RAM contents')
+    arg_parser.add_argument('--print', nargs='*', default=[], type=int,
+        metavar='ADDRESS', dest='addresses', help='RAM addresses to print')
+    arg_parser.add_argument('--jit', action='store_true',
+        help='compile basic blocks to Python functions')
+    arg_parser.add_argument('--profile', metavar='MAP',
+        help='report where cycles went, by the source map VMtranslator --map wrote')
+    arg_parser.add_argument('--top', type=int, default=20,
+        help='rows per profile table (default: 20)')
+    arg_parser.add_argument('--symbols',
+        help='.sym file written by assembler.py --symbols, to name the final pc')
+    args = arg_parser.parse_args()
+
+    if args.profile:
+        emulator_class = Profiler
+    else:
+        emulator_class = BlockEmulator if args.jit else Emulator
+    emulator = emulator_class(load_program(args.program))
+    for assignment in args.set:
+        address, value = assignment.split('=')
+        emulator.ram[int(address)] = int(value)
+    start = time.time()
+    cycles = emulator.run(args.max_cycles)
+    seconds = time.time() - start
+    print('{} cycles in {:.3f}s ({:.2f}M/s), {}'.format(cycles, seconds,
+        cycles / seconds / 1e6 if seconds else 0.0,
+        'halted' if emulator.halted else 'cycle limit reached'))
+    if args.symbols:
+        index = read_symbols(args.symbols)
+        print('pc = {} ({})'.format(emulator.pc, index.describe(emulator.pc, functions=True)))
+    for address in args.addresses:
+        print('RAM[{}] = {}'.format(address, emulator.ram[address]))
+    if args.profile:
+        with open(args.profile, 'r') as f:
+            source_map = json.load(f)
+        print()
+        print('\n'.join(hot_spots(emulator.counts(), source_map, args.top)))
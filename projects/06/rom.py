@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+'''
+Hack ROM images
+
+A ROM image is the packed form of a .hack file: one 16-bit big-endian word
+per instruction, no header. Pong.hack (17 bytes per instruction as text)
+becomes 2 bytes per instruction, and can be memory-mapped and read in place
+without parsing.
+
+Run as a script to convert between the two formats:
+    rom.py Prog.hack -> Prog.rom
+    rom.py Prog.rom -> Prog.hack
+'''
+
+import mmap
+import struct
+import sys
+from array import array
+
+WORD = struct.Struct('>H')
+
+
+def read_hack(hack_filename):
+    '''Return the instruction words of a .hack text file'''
+    with open(hack_filename, 'r') as hack:
+        return array('H', [int(line, 2) for line in hack if line.strip()])
+
+def write_hack(hack_filename, words):
+    with open(hack_filename, 'w') as hack:
+        hack.write(''.join(['{:016b}\n'.format(word) for word in words]))
+
+def write_rom(rom_filename, words):
+    '''Write all words with a single call from one big-endian buffer'''
+    words = array('H', words)
+    if sys.byteorder == 'little':
+        words.byteswap()
+    with open(rom_filename, 'wb') as rom:
+        words.tofile(rom)
+
+
+class ROMImage(object):
+    '''Read-only, memory-mapped view of a ROM image
+
+    rom[address] decodes a single word in place; words() decodes them all.
+    '''
+    def __init__(self, rom_filename):
+        self.rom_filename = rom_filename
+        self.file = open(rom_filename, 'rb')
+        self.file.seek(0, 2)
+        size = self.file.tell()
+        assert size % WORD.size == 0, 'ROM image must hold whole 16-bit words'
+        self.length = size // WORD.size
+        self.map = None
+        if size: # Empty files can't be mapped
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, address):
+        if not 0 <= address < self.length:
+            raise IndexError('ROM address {} out of range'.format(address))
+        return WORD.unpack_from(self.map, address * WORD.size)[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def words(self):
+        if not self.length:
+            return array('H')
+        return array('H', struct.unpack('>{}H'.format(self.length), self.map))
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+        self.file.close()
+
+
+def load_rom(rom_filename):
+    return ROMImage(rom_filename)
+
+def hack_to_rom(hack_filename):
+    rom_filename = hack_filename.replace('.hack', '.rom')
+    write_rom(rom_filename, read_hack(hack_filename))
+    return rom_filename
+
+def rom_to_hack(rom_filename):
+    hack_filename = rom_filename.replace('.rom', '.hack')
+    with load_rom(rom_filename) as rom:
+        write_hack(hack_filename, rom.words())
+    return hack_filename
+
+
+if __name__ == '__main__':
+    filename = sys.argv[1]
+    if filename.endswith('.hack'):
+        hack_to_rom(filename)
+    elif filename.endswith('.rom'):
+        rom_to_hack(filename)
+    else:
+        raise ValueError('{} is not a .hack or .rom file'.format(filename))
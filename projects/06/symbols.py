@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+'''
+Hack symbol files
+
+A symbol file records where the assembler put each label and variable, so
+that tools working on a .hack or .rom file can name addresses without
+assembling the program again. One symbol per line, labels (ROM) before
+variables (RAM), each sorted by address:
+
+    L 17 Main.main
+    L 45 Main$RET$0
+    V 16 Main.0
+
+The predefined symbols (SP, R0-R15, SCREEN, KBD...) are left out.
+
+Run as a script to look up addresses:
+    symbols.py Prog.sym 17 230
+'''
+
+from __future__ import print_function
+
+from array import array
+from bisect import bisect_left, bisect_right
+
+RAM_BASE = 16 # Address of the first variable
+
+
+def write_symbols(sym_filename, index):
+    '''Write a SymbolIndex'''
+    with open(sym_filename, 'w') as sym:
+        sym.write(''.join(['L {} {}\n'.format(address, name)
+            for name, address in index.label_pairs()]))
+        sym.write(''.join(['V {} {}\n'.format(address, name)
+            for name, address in index.variable_pairs()]))
+
+def read_symbols(sym_filename):
+    '''Return the SymbolIndex of a symbol file'''
+    labels, variables = [], []
+    tables = {'L': labels, 'V': variables}
+    with open(sym_filename, 'r') as sym:
+        for number, line in enumerate(sym, 1):
+            if not line.strip():
+                continue
+            try:
+                kind, address, name = line.split()
+                tables[kind].append((name, int(address)))
+            except (KeyError, ValueError):
+                raise ValueError('{}:{}: invalid symbol line {!r}'.format(
+                    sym_filename, number, line.rstrip('\n')))
+    return SymbolIndex(labels, variables)
+
+
+class SymbolIndex(object):
+    '''Labels and variables sorted by address, searched by bisection.
+
+    labels are (name, ROM address) pairs, variables (name, RAM address).
+    Each table is a pair of parallel sequences, addresses (a packed
+    array) and names. A ROM address may carry several labels; they keep
+    the order they were given in. Function labels are those without a
+    '$', which the VM translator puts in every label it scopes or
+    generates (Main$WHILE_END0, Main$RET$12), and are also indexed alone
+    so an address can be resolved to the function it is in.
+    '''
+    def __init__(self, labels, variables):
+        self.labels = self.sorted_table(labels)
+        self.functions = self.sorted_table(
+            [(name, address) for name, address in labels if '$' not in name])
+        self.variables = self.sorted_table(variables)
+        self.addresses = dict(labels)
+        self.addresses.update(variables)
+
+    def sorted_table(self, pairs):
+        pairs = sorted(pairs, key=lambda pair: pair[1]) # Stable
+        return (array('L', [address for name, address in pairs]),
+            [name for name, address in pairs])
+
+    def get_address(self, name):
+        return self.addresses[name]
+
+    def contains(self, name):
+        return name in self.addresses
+
+    def labels_at(self, address):
+        '''Names of the labels at a ROM address'''
+        addresses, names = self.labels
+        return names[bisect_left(addresses, address):bisect_right(addresses, address)]
+
+    def variable_at(self, address):
+        '''Name of the variable at a RAM address, or None'''
+        addresses, names = self.variables
+        index = bisect_left(addresses, address)
+        if index < len(addresses) and addresses[index] == address:
+            return names[index]
+        return None
+
+    def locate(self, address, functions=False):
+        '''(label, offset) of the nearest label at or before a ROM address,
+        or None. With functions set, only function labels count.
+        '''
+        addresses, names = self.functions if functions else self.labels
+        index = bisect_right(addresses, address)
+        if not index:
+            return None
+        index = bisect_left(addresses, addresses[index - 1]) # First label there
+        return names[index], address - addresses[index]
+
+    def describe(self, address, functions=False):
+        '''"Main.main+3" for a ROM address, or the address if no label precedes it'''
+        location = self.locate(address, functions)
+        if location is None:
+            return str(address)
+        name, offset = location
+        return '{}+{}'.format(name, offset) if offset else name
+
+    def label_pairs(self):
+        addresses, names = self.labels
+        return zip(names, addresses)
+
+    def variable_pairs(self):
+        addresses, names = self.variables
+        return zip(names, addresses)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(description='Hack symbol lookup')
+    arg_parser.add_argument('symbols', help='.sym file written by assembler.py --symbols')
+    arg_parser.add_argument('addresses', nargs='+', type=int, help='ROM addresses')
+    arg_parser.add_argument('--functions', action='store_true',
+        help='resolve to the enclosing function rather than the nearest label')
+    args = arg_parser.parse_args()
+
+    index = read_symbols(args.symbols)
+    for address in args.addresses:
+        print('{}: {}'.format(address, index.describe(address, args.functions)))
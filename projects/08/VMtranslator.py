@@ -5,73 +5,50 @@ Daniel Kronovet
 kronovet@gmail.com
 '''
 
+from __future__ import print_function
+
+import json
 import os
+from functools import partial
+from multiprocessing import Pool
 
 COMMENT = '//'
+INTERNAL = '$VM' # Prefix for code outside any file, never a file or class name
+CALL_ROUTINE = INTERNAL + '$CALL' # Shared routines, see CodeWriter(shared_calls=True)
+RETURN_ROUTINE = INTERNAL + '$RETURN'
+COMPARE_ROUTINE = INTERNAL + '${}' # One per operator, see CodeWriter(shared_compare=True)
+HALT_ROUTINE = INTERNAL + '$HALT'
+ENTRY_POINT = 'Sys.init' # Called by the bootstrap code
+MAX_DIRECT_INDEX = 3 # Largest segment index reached with A=M+1, A=A+1...
 
 # Create one per input file
 class Parser(object):
+    '''Stream the commands of a .vm file in one pass.
+
+    Iterating yields (command_type, arg1, arg2) tuples, classified as each
+    line is read. arg1 is the operation for C_ARITHMETIC; arg2 is an int,
+    or None for commands without one.
+    '''
     def __init__(self, vm_filename):
         self.vm_filename = vm_filename
-        self.vm = open(vm_filename, 'r')
-        self.EOF = False
         self.commands = self.commands_dict()
-        self.curr_instruction = None
-        self.initialize_file()
-
-    #######
-    ### API
-    def advance(self):
-        self.curr_instruction = self.next_instruction
-        self.load_next_instruction()
-
-    @property
-    def has_more_commands(self):
-        return not self.EOF
-
-    @property
-    def command_type(self):
-        return self.commands.get(self.curr_instruction[0].lower())
-
-    @property
-    def arg1(self):
-        '''Math operation if C_ARITHMETIC'''
-        if self.command_type == 'C_ARITHMETIC':
-            return self.argn(0)
-        return self.argn(1)
-
-    @property
-    def arg2(self):
-        '''Only return if C_PUSH, C_POP, C_FUNCTION, C_CALL'''
-        return self.argn(2)
 
-    ### END API
-    ###########
-    def close(self):
-        self.vm.close()
-
-    def initialize_file(self):
-        self.vm.seek(0)
-        self.load_next_instruction()
-
-    def load_next_instruction(self, line=None):
-        loaded = False
-        while not loaded and not self.EOF:
-            tell = self.vm.tell()
-            line = self.vm.readline().strip()
-            if self.is_instruction(line):
-                self.next_instruction = line.split(COMMENT)[0].strip().split()
-                loaded = True
-            if tell == self.vm.tell(): # File position did not change
-                self.EOF = True
-
-    def is_instruction(self, line):
-        return line and line[:2] != COMMENT
-
-    def argn(self, n):
-        if len(self.curr_instruction) >= n+1:
-            return self.curr_instruction[n]
-        return None
+    def __iter__(self):
+        commands = self.commands
+        with open(self.vm_filename, 'r') as vm:
+            for line in vm:
+                words = line.split(COMMENT, 1)[0].split()
+                if not words:
+                    continue
+                command_type = commands.get(words[0].lower())
+                if command_type is None:
+                    raise ValueError('{} is an invalid command'.format(words[0]))
+                if command_type == 'C_ARITHMETIC':
+                    yield command_type, words[0], None
+                elif len(words) == 3:
+                    yield command_type, words[1], int(words[2])
+                else:
+                    yield command_type, (words[1] if len(words) > 1 else None), None
 
     def commands_dict(self):
         return {
@@ -102,35 +79,93 @@ class CodeWriter(object):
     1. Contents of the A and D registries are not guaranteed,
         so methods must set them to the values they need.
     2. Methods must always leave @SP pointing to the correct location.
+
+    Lines are buffered and flushed once per function and per file. Set
+    comments=False for release builds: no VM source echo or ROM address
+    comments, which otherwise double the size of the output. Set
+    optimize=True to pass each flush through the Peephole optimizer, and
+    optimize_vm=True to pass each file's commands through VMOptimizer.
+
+    Set shared_calls=True to emit the call and return sequences once, as
+    routines at the end of the file, instead of inlining them at every
+    call and return. A call site passes the target in R13, the argument
+    count in R14 and the return address in R15.
+
+    Set shared_compare=True to do the same for eq, gt and lt: one routine
+    per operator, called with the return address in R13.
+
+    Set cache_stack=True to keep the top of the stack in D, and the entry
+    below it in R14 or R15, across pushes, pops and arithmetic, instead
+    of storing each value to RAM and bumping SP. self.cached lists where
+    the cached entries are, top last; the rest of the stack is in RAM as
+    usual. The cache is spilled to RAM before labels, jumps, calls and
+    returns, and at the end of each file, so control flow always meets
+    the plain stack layout.
+
+    With asm_filename None, flushed lines are kept in self.lines instead
+    of being written, for builds that assemble in memory.
+
+    Set source_map=True to record the VM command each instruction comes
+    from: self.sources holds (file, function, command number, VM text)
+    for every command, and self.source_map an index into it for every
+    ROM address. Commands are numbered from 1 in each file, so a number
+    is also a line in the .vm files JackAnalyzer writes. The buffer
+    carries a //#index marker ahead of each command's instructions.
     '''
-    def __init__(self, asm_filename):
-        self.asm = open(asm_filename, 'w')
+    def __init__(self, asm_filename, comments=True, optimize=False,
+            shared_calls=False, shared_compare=False, optimize_vm=False,
+            source_map=False, cache_stack=False):
+        self.asm = open(asm_filename, 'w') if asm_filename else None
+        self.lines = [] # Output, when there is no file
+        self.comments = comments
+        self.shared_calls = shared_calls
+        self.shared_compare = shared_compare
+        self.routines = set() # Shared routines jumped to so far
+        self.peephole = Peephole() if optimize else None
+        self.vm_optimizer = VMOptimizer() if optimize_vm else None
+        self.cache_stack = cache_stack
+        self.cached = [] # Registers holding the top of the stack, top last
+        self.savings = {} # File: [instructions before, after] optimization
+        self.buffer = [] # Lines not yet flushed to self.asm
+        self.sources = []
+        self.source_map = [] if source_map else None
+        self.source = None # Index of the command being emitted
         self.curr_file = None
+        self.curr_function = None
         self.addresses = self.address_dict()
+        self.keywords = self.keyword_dict()
         self.line_count = 0
-        self.bool_count = 0 # Number of boolean comparisons so far
-        self.call_count = 0 # Number of function calls so far
+        self.label_count = 0
+        self.unique_counts = {} # Kind: labels made so far, in this file
 
     #######
     ### API
     def write_init(self):
+        self.mark(0, 'bootstrap')
         self.write('@256')
         self.write('D=A')
         self.write('@SP')
         self.write('M=D')
-        self.write_call('Sys.init', 0)
+        self.write_call(ENTRY_POINT, 0)
         # self.write('@Sys.init')
         # self.write('0;JMP')
 
     def set_file_name(self, vm_filename):
         '''Reset pointers'''
+        self.flush()
         self.curr_file = vm_filename.replace('.vm', '').split('/')[-1]
+        self.curr_function = None
+        self.unique_counts = {}
         # self.curr_file = vm_filename.replace('.vm', '')
-        self.write('//////', code=False)
-        self.write('// {}'.format(self.curr_file), code=False)
+        self.write('//////')
+        self.write('// {}'.format(self.curr_file))
 
     def write_arithmetic(self, operation):
         '''Apply operation to top of stack'''
+        if self.shared_compare and operation in ['eq', 'gt', 'lt']:
+            self.write_compare_call(operation)
+            return
+
         if operation not in ['neg', 'not']: # Binary operator
             self.pop_stack_to_D()
         self.decrement_SP()
@@ -149,8 +184,9 @@ class CodeWriter(object):
         elif operation == 'not':
             self.write('M=!M')
         elif operation in ['eq', 'gt', 'lt']: # Boolean operators
+            true, end = self.unique_label('BOOL'), self.unique_label('ENDBOOL')
             self.write('D=M-D')
-            self.write('@BOOL{}'.format(self.bool_count))
+            self.write('@' + true)
 
             if operation == 'eq':
                 self.write('D;JEQ') # if x == y, x - y == 0
@@ -161,40 +197,43 @@ class CodeWriter(object):
 
             self.set_A_to_stack()
             self.write('M=0') # False
-            self.write('@ENDBOOL{}'.format(self.bool_count))
+            self.write('@' + end)
             self.write('0;JMP')
 
-            self.write('(BOOL{})'.format(self.bool_count), code=False)
+            self.write('({})'.format(true))
             self.set_A_to_stack()
             self.write('M=-1') # True
 
-            self.write('(ENDBOOL{})'.format(self.bool_count), code=False)
-            self.bool_count += 1
+            self.write('({})'.format(end))
         else:
             self.raise_unknown(operation)
         self.increment_SP()
 
     def write_push_pop(self, command, segment, index):
-        self.resolve_address(segment, index)
-        if command == 'C_PUSH': # load M[address] to D
-            if segment == 'constant':
-                self.write('D=A')
-            else:
-                self.write('D=M')
+        if command == 'C_PUSH':
+            self.load_D(segment, index)
             self.push_D_to_stack()
-        elif command == 'C_POP': # load D to M[address]
-            self.write('D=A')
-            self.write('@R13') # Store resolved address in R13
-            self.write('M=D')
+        elif command == 'C_POP' and self.is_direct(segment, index):
             self.pop_stack_to_D()
-            self.write('@R13')
-            self.write('A=M')
+            self.resolve_address(segment, index)
             self.write('M=D')
+        elif command == 'C_POP': # Address and value both need D
+            if segment not in ['local', 'argument', 'this', 'that']:
+                self.raise_unknown(segment)
+            self.write('@' + self.addresses[segment])
+            self.write('D=M')
+            self.write('@' + str(index))
+            self.write('D=D+A') # Address
+            self.write('@SP')
+            self.write('AM=M-1')
+            self.write('D=D+M') # Address + value
+            self.write('A=D-M') # Address
+            self.write('M=D-A') # Value
         else:
             self.raise_unknown(command)
 
     def write_label(self, label):
-        self.write('({}${})'.format(self.curr_file, label), code=False)
+        self.write('({}${})'.format(self.curr_file, label))
 
     def write_goto(self, label):
         self.write('@{}${}'.format(self.curr_file, label))
@@ -206,31 +245,28 @@ class CodeWriter(object):
         self.write('D;JNE')
 
     def write_function(self, function_name, num_locals):
+        self.flush()
+
         # (f)
-        self.write('({})'.format(function_name), code=False)
+        self.write('({})'.format(function_name))
 
         # k times: push 0
-        for _ in xrange(num_locals): # Initialize local vars to 0
+        for _ in range(num_locals): # Initialize local vars to 0
             self.write('D=0')
             self.push_D_to_stack()
 
     def write_call(self, function_name, num_args):
-        RET = function_name + 'RET' +  str(self.call_count) # Unique return label
-        self.call_count += 1
+        RET = self.unique_label('RET')
+        if self.shared_calls:
+            self.write_call_site(function_name, num_args, RET)
+            return
 
         # push return-address
         self.write('@' + RET)
         self.write('D=A')
         self.push_D_to_stack()
 
-        # push LCL
-        # push ARG
-        # push THIS
-        # push THAT
-        for address in ['@LCL', '@ARG', '@THIS', '@THAT']:
-            self.write(address)
-            self.write('D=M')
-            self.push_D_to_stack()
+        self.push_frame()
 
         # LCL = SP
         self.write('@SP')
@@ -251,9 +287,153 @@ class CodeWriter(object):
         self.write('0;JMP')
 
         # (return_address)
-        self.write('({})'.format(RET), code=False)
+        self.write('({})'.format(RET))
 
     def write_return(self):
+        if self.shared_calls:
+            self.routines.add(RETURN_ROUTINE)
+            self.write('@' + RETURN_ROUTINE)
+            self.write('0;JMP')
+            return
+        self.write_return_body()
+
+    ### END API
+    ###########
+    def write_call_site(self, function_name, num_args, return_label):
+        '''Jump to the shared call routine; about 13 instructions, not 45'''
+        self.write('@' + function_name)
+        self.write('D=A')
+        self.write('@R13')
+        self.write('M=D')
+        if num_args in [0, 1]:
+            self.write('@R14')
+            self.write('M={}'.format(num_args))
+        else:
+            self.write('@' + str(num_args))
+            self.write('D=A')
+            self.write('@R14')
+            self.write('M=D')
+        self.write('@' + return_label)
+        self.write('D=A')
+        self.write('@R15')
+        self.write('M=D')
+        self.routines.add(CALL_ROUTINE)
+        self.write('@' + CALL_ROUTINE)
+        self.write('0;JMP')
+        self.write('({})'.format(return_label))
+
+    def write_compare_call(self, operation):
+        '''Jump to the shared routine for operation; 5 instructions, 1 label'''
+        RET = self.unique_label('BOOL')
+        routine = COMPARE_ROUTINE.format(operation.upper())
+        self.routines.add(routine)
+        self.write('@' + RET)
+        self.write('D=A')
+        self.write('@R13')
+        self.write('M=D')
+        self.write('@' + routine)
+        self.write('0;JMP')
+        self.write('({})'.format(RET))
+
+    def unique_label(self, kind):
+        '''file$kind$n, numbered within the current file so that files can
+        be translated independently. VM labels can't contain $, so these
+        never clash with the file's own labels (file$label). Code outside
+        any file (the bootstrap) uses INTERNAL in place of the file name.
+        '''
+        count = self.unique_counts.get(kind, 0)
+        self.unique_counts[kind] = count + 1
+        return '{}${}${}'.format(self.curr_file or INTERNAL, kind, count)
+
+    def write_shared_routines(self):
+        '''Emit the routines that call sites and returns jumped to.
+
+        They follow an infinite loop, so a program that runs off its end
+        (as the projects/07 tests do) stops there instead of falling in.
+        '''
+        self.flush()
+        self.curr_file = 'shared routines'
+        self.write('//////')
+        self.mark_routine(HALT_ROUTINE)
+        self.write('({})'.format(HALT_ROUTINE))
+        self.write('@{}'.format(HALT_ROUTINE))
+        self.write('0;JMP')
+        if CALL_ROUTINE in self.routines:
+            self.mark_routine(CALL_ROUTINE)
+            self.write_call_routine()
+        if RETURN_ROUTINE in self.routines:
+            self.mark_routine(RETURN_ROUTINE)
+            self.write('// return')
+            self.write('({})'.format(RETURN_ROUTINE))
+            self.write_return_body()
+        for operation in ['eq', 'gt', 'lt']:
+            if COMPARE_ROUTINE.format(operation.upper()) in self.routines:
+                self.mark_routine(COMPARE_ROUTINE.format(operation.upper()))
+                self.write_compare_routine(operation)
+
+    def mark_routine(self, routine):
+        self.curr_function = routine
+        self.mark(0, routine)
+
+    def write_compare_routine(self, operation):
+        '''x = (x op y) for the top two stack entries, then goto R13'''
+        routine = COMPARE_ROUTINE.format(operation.upper())
+        self.write('// {}: R13 = return-address'.format(operation))
+        self.write('({})'.format(routine))
+        self.pop_stack_to_D()
+        self.write('A=A-1')
+        self.write('D=M-D')
+        self.write('M=-1') # True
+        self.write('@{}_END'.format(routine))
+        self.write('D;J{}'.format(operation.upper())) # Compare x - y to 0
+        self.write('@SP')
+        self.write('A=M-1')
+        self.write('M=0') # False
+        self.write('({}_END)'.format(routine))
+        self.write('@R13')
+        self.write('A=M')
+        self.write('0;JMP')
+
+    def write_call_routine(self):
+        self.write('// call: R13 = function, R14 = num_args, R15 = return-address')
+        self.write('({})'.format(CALL_ROUTINE))
+        self.write('@R15')
+        self.write('D=M')
+        self.push_D_to_stack()
+        self.push_frame()
+
+        # ARG = SP-n-5
+        self.write('@SP')
+        self.write('D=M')
+        self.write('@R14')
+        self.write('D=D-M')
+        self.write('@5')
+        self.write('D=D-A')
+        self.write('@ARG')
+        self.write('M=D')
+
+        # LCL = SP
+        self.write('@SP')
+        self.write('D=M')
+        self.write('@LCL')
+        self.write('M=D')
+
+        # goto f
+        self.write('@R13')
+        self.write('A=M')
+        self.write('0;JMP')
+
+    def push_frame(self):
+        # push LCL
+        # push ARG
+        # push THIS
+        # push THAT
+        for address in ['@LCL', '@ARG', '@THIS', '@THAT']:
+            self.write(address)
+            self.write('D=M')
+            self.push_D_to_stack()
+
+    def write_return_body(self):
         # Temporary variables
         FRAME = 'R13'
         RET = 'R14'
@@ -308,23 +488,430 @@ class CodeWriter(object):
         self.write('A=M')
         self.write('0;JMP')
 
-    ### END API
-    ###########
-    def write(self, command, code=True):
-        self.asm.write(command)
-        if code:
-            self.asm.write(' // ' + str(self.line_count))
-            self.line_count += 1
-        self.asm.write('\n')
+    def write_move(self, source, destination):
+        '''push source, pop destination, without going through the stack'''
+        segment, index = destination
+        if not self.is_direct(segment, index):
+            self.resolve_address(segment, index)
+            self.write('D=A')
+            self.write('@R13') # Store resolved address in R13
+            self.write('M=D')
+            self.load_D(*source)
+            self.write('@R13')
+            self.write('A=M')
+            self.write('M=D')
+        else:
+            self.load_D(*source)
+            self.store_D(segment, index)
+
+    def write_apply(self, operation, operand):
+        '''push operand, operation: the top of stack is updated in place'''
+        if operand == ('constant', 1) and operation in ['add', 'sub']:
+            self.write('@SP')
+            self.write('A=M-1')
+            self.write('M=M+1' if operation == 'add' else 'M=M-1')
+            return
+        self.load_D(*operand)
+        self.write('@SP')
+        self.write('A=M-1')
+        if operation == 'add':
+            self.write('M=M+D')
+        elif operation == 'sub':
+            self.write('M=M-D')
+        elif operation == 'and':
+            self.write('M=M&D')
+        elif operation == 'or':
+            self.write('M=M|D')
+        else:
+            self.raise_unknown(operation)
+
+    def write_if_value(self, label, operand):
+        '''push operand, if-goto label'''
+        self.load_D(*operand)
+        self.write('@{}${}'.format(self.curr_file, label))
+        self.write('D;JNE')
+
+    def write_if_not(self, label):
+        '''not, if-goto label: jump unless the top of stack is -1 (true)'''
+        self.pop_stack_to_D()
+        self.write('D=D+1')
+        self.write('@{}${}'.format(self.curr_file, label))
+        self.write('D;JNE')
+
+    def write_if_compare(self, label, comparison):
+        '''[push operand,] eq|gt|lt, [not,] if-goto label
+
+        comparison is (operation, negated, operand); operand is None when
+        both values are already on the stack.
+        '''
+        operation, negated, operand = comparison
+        if operand is None:
+            self.pop_stack_to_D() # y
+        else:
+            self.load_D(*operand)
+        self.decrement_SP()
+        self.write('A=M')
+        self.write('D=M-D') # x - y
+        self.write('@{}${}'.format(self.curr_file, label))
+        self.write('D;' + self.jump_dict()[operation, negated])
+
+    def write_cached(self, command_type, arg1, arg2):
+        '''Translate a command against the cached top of stack. Returns
+        False, writing nothing, if the command needs the stack in RAM.
+        '''
+        depth = len(self.cached)
+        if command_type == 'C_PUSH':
+            self.make_room()
+            self.load_D(arg1, arg2)
+            self.cached.append('D')
+        elif command_type == 'C_POP':
+            self.fill()
+            self.store_top(arg1, arg2)
+            self.drop()
+        elif command_type == 'C_ARITHMETIC':
+            if self.shared_compare and arg1 in ['eq', 'gt', 'lt']:
+                return False
+            self.write_cached_arithmetic(arg1)
+        elif command_type == 'C_APPLY':
+            self.write_cached_apply(arg1, arg2)
+        elif command_type in ['C_IF', 'C_IF_NOT'] and depth < 2:
+            self.fill()
+            if command_type == 'C_IF_NOT':
+                self.write('D=D+1')
+            self.write('@{}${}'.format(self.curr_file, arg1))
+            self.write('D;JNE')
+            self.cached = []
+        elif command_type == 'C_IF_COMPARE' and depth:
+            operation, negated, operand = arg2
+            if operand is None:
+                self.load_second('D=M-D') # x - y
+            elif depth == 1:
+                self.apply_to_D('sub', operand)
+            else:
+                return False
+            self.write('@{}${}'.format(self.curr_file, arg1))
+            self.write('D;' + self.jump_dict()[operation, negated])
+            self.cached = []
+        else:
+            return False
+        return True
+
+    def write_cached_arithmetic(self, operation):
+        if operation in ['neg', 'not']:
+            if not self.cached:
+                self.write('@SP')
+                self.write('A=M-1')
+                self.write('M=-M' if operation == 'neg' else 'M=!M')
+            else:
+                self.write('D=-D' if operation == 'neg' else 'D=!D')
+            return
+
+        if operation in ['eq', 'gt', 'lt']:
+            self.fill()
+            self.load_second('D=M-D') # x - y
+            true, end = self.unique_label('BOOL'), self.unique_label('ENDBOOL')
+            self.write('@' + true)
+            self.write('D;J' + operation.upper())
+            self.write('D=0') # False
+            self.write('@' + end)
+            self.write('0;JMP')
+            self.write('({})'.format(true))
+            self.write('D=-1') # True
+            self.write('({})'.format(end))
+            return
+
+        if operation not in self.cached_operator_dict():
+            self.raise_unknown(operation)
+        if not self.cached: # Both in RAM: update x in place
+            self.write('@SP')
+            self.write('AM=M-1')
+            self.write('D=M')
+            self.write('A=A-1')
+            self.write({'add': 'M=M+D', 'sub': 'M=M-D', 'and': 'M=M&D',
+                'or': 'M=M|D'}[operation])
+        else:
+            self.load_second(self.cached_operator_dict()[operation])
+
+    def write_cached_apply(self, operation, operand):
+        '''push operand, operation, with the result left in D'''
+        if not self.cached and not self.is_direct(*operand):
+            self.load_D(*operand) # Loading needs D, so pop x after
+            self.cached.append('D')
+            self.load_second(self.cached_operator_dict()[operation])
+            return
+        self.fill()
+        self.apply_to_D(operation, operand)
+
+    def apply_to_D(self, operation, operand):
+        '''D = D operation operand, D being the top of the stack'''
+        segment, index = operand
+        if operand == ('constant', 1) and operation in ['add', 'sub']:
+            self.write('D=D+1' if operation == 'add' else 'D=D-1')
+        elif self.is_direct(segment, index):
+            self.resolve_address(segment, index)
+            source = 'A' if segment == 'constant' else 'M'
+            self.write({'add': 'D=D+{}', 'sub': 'D=D-{}', 'and': 'D=D&{}',
+                'or': 'D=D|{}'}[operation].format(source))
+        else:
+            self.write('@R13') # Loading the operand needs D
+            self.write('M=D')
+            self.load_D(segment, index)
+            self.write('@R13')
+            self.write(self.cached_operator_dict()[operation])
+
+    def load_second(self, instruction):
+        '''Run instruction with M the second entry and D the top; the
+        result, in D, replaces them both'''
+        if len(self.cached) == 2:
+            self.write('@' + self.cached[0])
+        else:
+            self.write('@SP')
+            self.write('AM=M-1')
+        self.write(instruction)
+        self.cached = ['D']
+
+    def store_top(self, segment, index):
+        '''segment index = D, the top of the stack'''
+        if segment != 'constant' and self.is_direct(segment, index):
+            self.resolve_address(segment, index)
+        elif segment in ['local', 'argument', 'this', 'that']:
+            self.write('@R13')
+            self.write('M=D')
+            self.write('@' + self.addresses[segment])
+            self.write('D=M')
+            self.write('@' + str(index))
+            self.write('D=D+A') # Address
+            self.write('@R13')
+            self.write('D=D+M') # Address + value
+            self.write('A=D-M') # Address
+            self.write('M=D-A') # Value
+            return
+        else:
+            self.raise_unknown(segment)
+        self.write('M=D')
+
+    def fill(self):
+        '''Make sure the top of the stack is in D'''
+        if not self.cached:
+            self.write('@SP')
+            self.write('AM=M-1')
+            self.write('D=M')
+            self.cached = ['D']
+
+    def drop(self):
+        '''Discard the top of the stack, once D has been used'''
+        self.cached.pop()
+        if self.cached:
+            self.write('@' + self.cached[0])
+            self.write('D=M')
+            self.cached = ['D']
+
+    def make_room(self):
+        '''Free D for the next push, spilling the second entry to RAM'''
+        if not self.cached:
+            return
+        register = 'R14'
+        if len(self.cached) == 2:
+            second = self.cached[0]
+            register = 'R15' if second == 'R14' else 'R14'
+            self.write('@' + register)
+            self.write('M=D')
+            self.write('@' + second)
+            self.write('D=M')
+            self.write('@SP')
+            self.write('M=M+1')
+            self.write('A=M-1')
+            self.write('M=D')
+        else:
+            self.write('@' + register)
+            self.write('M=D')
+        self.cached = [register]
+
+    def spill(self):
+        '''Write the cached entries to the stack in RAM'''
+        if len(self.cached) == 2:
+            self.write('@SP')
+            self.write('AM=M+1')
+            self.write('M=D') # Top
+            self.write('@' + self.cached[0])
+            self.write('D=M')
+            self.write('@SP')
+            self.write('A=M-1')
+            self.write('M=D') # Second
+            self.write('@SP')
+            self.write('M=M+1')
+        elif self.cached:
+            self.write('@SP')
+            self.write('M=M+1')
+            self.write('A=M-1')
+            self.write('M=D')
+        self.cached = []
+
+    def write_commands(self, commands):
+        '''Translate a stream of (command_type, arg1, arg2) tuples'''
+        commands = enumerate(commands, 1)
+        if self.vm_optimizer:
+            commands = self.vm_optimizer.optimize(commands)
+        for number, (command_type, arg1, arg2) in commands:
+            if command_type == 'C_FUNCTION':
+                self.curr_function = arg1
+            self.write_source(number, command_type, arg1, arg2)
+            if self.cache_stack:
+                if self.write_cached(command_type, arg1, arg2):
+                    continue
+                self.spill()
+            if command_type == 'C_PUSH' or command_type == 'C_POP':
+                self.write_push_pop(command_type, arg1, arg2)
+            elif command_type == 'C_ARITHMETIC':
+                self.write_arithmetic(arg1)
+            elif command_type == 'C_LABEL':
+                self.write_label(arg1)
+            elif command_type == 'C_GOTO':
+                self.write_goto(arg1)
+            elif command_type == 'C_IF':
+                self.write_if(arg1)
+            elif command_type == 'C_FUNCTION':
+                self.write_function(arg1, arg2)
+            elif command_type == 'C_CALL':
+                self.write_call(arg1, arg2)
+            elif command_type == 'C_RETURN':
+                self.write_return()
+            elif command_type == 'C_MOVE':
+                self.write_move(arg1, arg2)
+            elif command_type == 'C_APPLY':
+                self.write_apply(arg1, arg2)
+            elif command_type == 'C_IF_VALUE':
+                self.write_if_value(arg1, arg2)
+            elif command_type == 'C_IF_NOT':
+                self.write_if_not(arg1)
+            elif command_type == 'C_IF_COMPARE':
+                self.write_if_compare(arg1, arg2)
+            else:
+                self.raise_unknown(command_type)
+        self.spill()
+
+    def write_source(self, number, command_type, arg1, arg2):
+        '''Echo the VM command as a comment, and mark it for the source map'''
+        if not self.comments and self.source_map is None:
+            return
+        if command_type == 'C_ARITHMETIC':
+            source = arg1
+        elif command_type in VMOptimizer.COMMANDS:
+            source = '; '.join(VMOptimizer.source(command_type, arg1, arg2))
+        else:
+            args = [str(arg) for arg in (arg1, arg2) if arg is not None]
+            source = ' '.join([self.keywords[command_type]] + args)
+        self.mark(number, source)
+        if self.comments:
+            self.write('// ' + source)
+
+    def mark(self, number, source):
+        '''Attribute the instructions that follow to a VM command'''
+        if self.source_map is None:
+            return
+        self.write('//#{}'.format(len(self.sources)))
+        self.sources.append((self.curr_file, self.curr_function, number, source))
+
+    def write(self, command):
+        '''Buffer one line: an instruction, a label or a comment.
+
+        Comment lines always start with '//' and labels with '(', which
+        is how emit() tells them apart from instructions.
+        '''
+        self.buffer.append(command)
+
+    def flush(self):
+        '''Optimize the buffer if asked to, then emit it'''
+        if not self.buffer:
+            return
+        buffer = self.buffer
+        if self.peephole:
+            buffer = self.peephole.optimize(buffer)
+            counts = self.savings.setdefault(self.curr_file or 'bootstrap', [0, 0])
+            counts[0] += count_instructions(self.buffer)
+            counts[1] += count_instructions(buffer)
+        self.buffer = []
+        self.emit(buffer)
+
+    def merge(self, lines, routines, savings, sources):
+        '''Emit the output of a file translated by translate_file'''
+        self.flush()
+        self.routines.update(routines)
+        self.savings.update(savings)
+        offset = len(self.sources)
+        self.sources.extend(sources)
+        self.emit(lines, offset)
+
+    def emit(self, buffer, offset=0):
+        '''Write out lines, numbering instructions by ROM address.
+
+        offset is added to the index in each source map marker.
+        '''
+        lines = []
+        line_count = self.line_count
+        source_map = self.source_map
+        for line in buffer:
+            if line[0] == '/':
+                if line.startswith('//#'):
+                    self.source = int(line[3:]) + offset
+                elif self.comments:
+                    lines.append(line)
+            elif line[0] == '(':
+                lines.append(line)
+                self.label_count += 1
+            else:
+                if self.comments:
+                    line += ' // ' + str(line_count)
+                if source_map is not None:
+                    source_map.append(self.source)
+                lines.append(line)
+                line_count += 1
+        self.line_count = line_count
+        if self.asm is None:
+            self.lines.extend(lines)
+        elif lines:
+            self.asm.write('\n'.join(lines) + '\n')
 
     def close(self):
-        self.asm.close()
+        if self.routines:
+            self.write_shared_routines()
+        self.flush()
+        if self.asm is not None:
+            self.asm.close()
+
+    def source_map_dict(self):
+        return {'sources': self.sources, 'addresses': self.source_map}
+
+    def write_source_map(self, map_filename):
+        '''Write the source map as JSON, for emulator.py --profile'''
+        with open(map_filename, 'w') as f:
+            json.dump(self.source_map_dict(), f)
 
     def raise_unknown(self, argument):
         raise ValueError('{} is an invalid argument'.format(argument))
 
+    def load_D(self, segment, index):
+        '''D = the value of segment index'''
+        self.resolve_address(segment, index)
+        if segment == 'constant':
+            self.write('D=A')
+        else:
+            self.write('D=M')
+
+    def store_D(self, segment, index):
+        '''segment index = D, for addresses that don't need D (is_direct)'''
+        if segment == 'constant' or not self.is_direct(segment, index):
+            self.raise_unknown(segment)
+        self.resolve_address(segment, index)
+        self.write('M=D')
+
     def resolve_address(self, segment, index):
-        '''Resolve address to A register'''
+        '''Resolve address to A register.
+
+        Leaves D alone if is_direct(segment, index): indices up to
+        MAX_DIRECT_INDEX are reached by stepping A from the segment base,
+        which takes no more instructions than adding the index in D.
+        '''
         address = self.addresses.get(segment)
         if segment == 'constant':
             self.write('@' + str(index))
@@ -332,6 +919,11 @@ class CodeWriter(object):
             self.write('@' + self.curr_file + '.' + str(index))
         elif segment in ['pointer', 'temp']:
             self.write('@R' + str(address + index)) # Address is an int
+        elif segment in ['local', 'argument', 'this', 'that'] and index <= MAX_DIRECT_INDEX:
+            self.write('@' + address)
+            self.write('A=M' if index == 0 else 'A=M+1')
+            for _ in range(index - 1):
+                self.write('A=A+1')
         elif segment in ['local', 'argument', 'this', 'that']:
             self.write('@' + address) # Address is a string
             self.write('D=M')
@@ -340,6 +932,11 @@ class CodeWriter(object):
         else:
             self.raise_unknown(segment)
 
+    def is_direct(self, segment, index):
+        '''True if resolve_address(segment, index) leaves D alone'''
+        return (segment in ['constant', 'static', 'pointer', 'temp'] or
+            (segment in ['local', 'argument', 'this', 'that'] and index <= MAX_DIRECT_INDEX))
+
     def address_dict(self):
         return {
             'local': 'LCL', # Base R1
@@ -352,6 +949,38 @@ class CodeWriter(object):
             'static': 16, # Edit R16-255
         }
 
+    def cached_operator_dict(self):
+        '''x op y into D, with x in M and y in D'''
+        return {
+            'add': 'D=D+M',
+            'sub': 'D=M-D',
+            'and': 'D=D&M',
+             'or': 'D=D|M',
+        }
+
+    def jump_dict(self):
+        '''(comparison, negated): jump on x - y'''
+        return {
+            ('eq', False): 'JEQ',
+            ('gt', False): 'JGT',
+            ('lt', False): 'JLT',
+             ('eq', True): 'JNE',
+             ('gt', True): 'JLE',
+             ('lt', True): 'JGE',
+        }
+
+    def keyword_dict(self):
+        return {
+           'C_PUSH': 'push',
+            'C_POP': 'pop',
+          'C_LABEL': 'label',
+           'C_GOTO': 'goto',
+             'C_IF': 'if-goto',
+       'C_FUNCTION': 'function',
+         'C_RETURN': 'return',
+           'C_CALL': 'call',
+        }
+
     def push_D_to_stack(self):
         '''Push from D onto top of stack, increment @SP'''
         self.write('@SP') # Get current stack pointer
@@ -378,14 +1007,387 @@ class CodeWriter(object):
         self.write('A=M')
 
 
+class FileWriter(CodeWriter):
+    '''Translates one file on its own, keeping what it emits unnumbered
+    in self.lines for a CodeWriter to merge'''
+    def __init__(self, **options):
+        CodeWriter.__init__(self, None, **options)
+
+    def emit(self, lines):
+        self.lines.extend(lines)
+
+
+class VMOptimizer(object):
+    '''Rewrite windows of VM commands into cheaper equivalents.
+
+    Commands are copied to the output one at a time, and each rule looks
+    at the end of the output, so one rewrite can enable the next: push
+    constant 2, push constant 3, add, push constant 1, add becomes push
+    constant 6. A label, function or call is never part of a window, so
+    control can't enter one halfway through.
+    1. push constant a, push constant b, add|sub|and|or becomes push
+        constant (a op b), if the result is a constant
+    2. push constant 0, add|sub|or and not, not and neg, neg are removed
+    3. push x, pop y becomes C_MOVE x y: a direct memory move
+    4. push x, add|sub|and|or becomes C_APPLY op x, which updates the top
+        of stack in place
+    5. push x, if-goto becomes C_IF_VALUE, which jumps on x without
+        pushing it. A constant x becomes a goto, or nothing.
+    6. not, if-goto becomes C_IF_NOT
+    7. [push y,] eq|gt|lt, [not,] if-goto becomes C_IF_COMPARE, which
+        jumps on x - y without making a boolean
+
+    Operands x and y are (segment, index) pairs.
+    '''
+    COMMANDS = ['C_MOVE', 'C_APPLY', 'C_IF_VALUE', 'C_IF_NOT', 'C_IF_COMPARE']
+
+    def optimize(self, commands):
+        '''Take and return (number, command) pairs; a rewritten command
+        takes the number of the first command it replaces
+        '''
+        self.out, self.numbers = [], []
+        out = self.out
+        for number, command in commands:
+            self.number = number
+            command_type, arg1, arg2 = command
+            if command_type == 'C_ARITHMETIC':
+                self.append_arithmetic(out, arg1)
+            elif command_type == 'C_POP' and self.is_push(out, -1):
+                self.replace(1, ('C_MOVE', out[-1][1:], (arg1, arg2)))
+            elif command_type == 'C_IF':
+                self.append_if(out, arg1)
+            else:
+                self.replace(0, command)
+        return list(zip(self.numbers, self.out))
+
+    def replace(self, count, command):
+        '''Replace the last count commands, and the current one, with command'''
+        number = self.numbers[-count] if count else self.number
+        self.remove(count)
+        self.out.append(command)
+        self.numbers.append(number)
+
+    def remove(self, count):
+        '''Drop the last count commands, and the current one'''
+        if count:
+            del self.out[-count:]
+            del self.numbers[-count:]
+
+    def append_arithmetic(self, out, operation):
+        if operation in ['add', 'sub', 'and', 'or'] and self.is_push(out, -1):
+            operand = out[-1][1:]
+            if operand == ('constant', 0) and operation != 'and': # Rule 2
+                self.remove(1)
+                return
+            if operand[0] == 'constant' and self.is_push(out, -2, 'constant'):
+                value = self.fold(operation, out[-2][2], operand[1])
+                if 0 <= value <= 32767: # Rule 1
+                    self.replace(2, ('C_PUSH', 'constant', value))
+                    return
+            self.replace(1, ('C_APPLY', operation, operand)) # Rule 4
+            return
+        if operation in ['not', 'neg'] and out and out[-1] == ('C_ARITHMETIC', operation, None):
+            self.remove(1) # Rule 2
+            return
+        self.replace(0, ('C_ARITHMETIC', operation, None))
+
+    def append_if(self, out, label):
+        if self.is_push(out, -1):
+            operand = out[-1][1:]
+            if operand[0] != 'constant': # Rule 5
+                self.replace(1, ('C_IF_VALUE', label, operand))
+            elif operand[1] != 0:
+                self.replace(1, ('C_GOTO', label, None))
+            else:
+                self.remove(1)
+            return
+        negated = self.is_arithmetic(out, -1, ['not'])
+        if negated and self.is_push(out, -2, 'constant'): # Never -1, so not is true
+            self.replace(2, ('C_GOTO', label, None))
+            return
+        count = 2 if negated else 1
+        if self.is_arithmetic(out, -count, ['eq', 'gt', 'lt']): # Rule 7
+            operation = out[-count][1]
+            operand = None
+            if self.is_push(out, -count - 1):
+                count += 1
+                operand = out[-count][1:]
+            self.replace(count, ('C_IF_COMPARE', label, (operation, negated, operand)))
+        elif negated: # Rule 6
+            self.replace(1, ('C_IF_NOT', label, None))
+        else:
+            self.replace(0, ('C_IF', label, None))
+
+    def is_push(self, out, offset, segment=None):
+        return (len(out) >= -offset and out[offset][0] == 'C_PUSH'
+            and segment in [None, out[offset][1]])
+
+    def is_arithmetic(self, out, offset, operations):
+        return (len(out) >= -offset and out[offset][0] == 'C_ARITHMETIC'
+            and out[offset][1] in operations)
+
+    def fold(self, operation, a, b):
+        if operation == 'add':
+            return a + b
+        if operation == 'sub':
+            return a - b
+        if operation == 'and':
+            return a & b
+        return a | b
+
+    @staticmethod
+    def source(command_type, arg1, arg2):
+        '''The VM commands a rewritten command stands for'''
+        if command_type == 'C_MOVE':
+            return ['push {} {}'.format(*arg1), 'pop {} {}'.format(*arg2)]
+        if command_type == 'C_APPLY':
+            return ['push {} {}'.format(*arg2), arg1]
+        if command_type == 'C_IF_VALUE':
+            return ['push {} {}'.format(*arg2), 'if-goto ' + arg1]
+        if command_type == 'C_IF_NOT':
+            return ['not', 'if-goto ' + arg1]
+        operation, negated, operand = arg2
+        return (['push {} {}'.format(*operand)] if operand else []) + [operation] + (
+            ['not'] if negated else []) + ['if-goto ' + arg1]
+
+
+class Peephole(object):
+    '''Remove redundant instructions from a block of CodeWriter output.
+
+    CodeWriter methods assume nothing about A and D on entry, so adjacent
+    methods repeat each other's work. Each rule below is applied as lines
+    are copied to the output, looking back over the instructions already
+    copied. Comments are skipped over; labels are jump targets, so no
+    rule looks back past one.
+    1. @X is dropped if A already holds X, e.g. @SP M=M+1 @SP A=M
+    2. M=M+1 followed by M=M-1 (or the reverse) cancel out
+    3. M=M-1 A=M becomes AM=M-1
+    4. A=x D=A @Y becomes D=x @Y, since @Y overwrites A anyway
+    5. @SP A=M M=D @SP A=M D=M, a push of D straight after a pop to D
+        once rules 1-2 have run, becomes @SP A=M M=D
+    '''
+    def optimize(self, lines):
+        out = []
+        a_value = None # Symbol or constant known to be in A
+        for line in lines:
+            if line[0] == '/':
+                out.append(line)
+                continue
+            if line[0] == '(':
+                a_value = None
+                out.append(line)
+                continue
+
+            if line[0] == '@':
+                if line[1:] == a_value: # Rule 1
+                    continue
+                previous = self.previous(out, 2)
+                if (len(previous) == 2 and previous[0][1][:2] == 'A='
+                        and previous[1][1] == 'D=A'): # Rule 4
+                    out[previous[0][0]] = 'D=' + previous[0][1][2:]
+                    del out[previous[1][0]]
+                a_value = line[1:]
+                out.append(line)
+                continue
+
+            previous = self.previous(out, 5)
+            last = previous[-1][1] if previous else None
+            if (line, last) in [('M=M-1', 'M=M+1'), ('M=M+1', 'M=M-1')]: # Rule 2
+                del out[previous[-1][0]]
+                continue
+            if line == 'A=M' and last == 'M=M-1': # Rule 3
+                out[previous[-1][0]] = 'AM=M-1'
+                a_value = None
+                continue
+            if (line == 'D=M' and [command for index, command in previous] ==
+                    ['@SP', 'A=M', 'M=D', '@SP', 'A=M']): # Rule 5
+                del out[previous[4][0]]
+                del out[previous[3][0]]
+                a_value = None
+                continue
+
+            if 'A' in line.split('=')[0] and '=' in line: # A overwritten
+                a_value = None
+            out.append(line)
+        return out
+
+    def previous(self, out, n):
+        '''Up to n (index, instruction) pairs before the end of out,
+        oldest first, stopping at a label
+        '''
+        previous = []
+        index = len(out) - 1
+        while index >= 0 and len(previous) < n:
+            line = out[index]
+            if line[0] == '(':
+                break
+            if line[0] != '/':
+                previous.append((index, line))
+            index -= 1
+        previous.reverse()
+        return previous
+
+
+def count_instructions(lines):
+    return sum(1 for line in lines if line[0] not in '/(')
+
+
+class CallGraph(object):
+    '''Which functions each function calls, across all files of a program.
+
+    Files are (name, commands) pairs, the commands being the tuples Parser
+    yields. Calls made before a file's first function (the projects/07
+    tests have no functions at all) are made by None.
+    '''
+    def __init__(self, files):
+        self.calls = {None: set()} # Function: names it calls
+        for name, commands in files:
+            function = None
+            for command_type, arg1, arg2 in commands:
+                if command_type == 'C_FUNCTION':
+                    function = arg1
+                    self.calls[function] = set()
+                elif command_type == 'C_CALL':
+                    self.calls[function].add(arg1)
+
+    def reachable(self, entry_point):
+        '''Functions entry_point or top-level code can call, directly or
+        not, and entry_point itself
+        '''
+        live = set([entry_point])
+        live.update(self.calls[None])
+        stack = list(live)
+        while stack:
+            for callee in self.calls.get(stack.pop(), ()):
+                if callee not in live:
+                    live.add(callee)
+                    stack.append(callee)
+        return live
+
+    def split(self, files, entry_point=ENTRY_POINT):
+        '''Return (live files, dead files), each as (name, commands) pairs.
+
+        Dead files hold the functions that can't be reached from
+        entry_point. Without an entry point this is not a whole program,
+        so nothing is dead.
+        '''
+        if entry_point not in self.calls:
+            return files, []
+        live = self.reachable(entry_point)
+        live_files, dead_files = [], []
+        for name, commands in files:
+            kept, removed = [], []
+            output = kept
+            for command in commands:
+                if command[0] == 'C_FUNCTION':
+                    output = kept if command[1] in live else removed
+                output.append(command)
+            if kept:
+                live_files.append((name, kept))
+            if removed:
+                dead_files.append((name, removed))
+        assert not CallGraph(dead_files).called_by(live_files), \
+            'Stripped a function that live code calls'
+        return live_files, dead_files
+
+    def called_by(self, files):
+        '''Functions defined here that the commands of files call'''
+        return set(command[1] for name, commands in files
+            for command in commands if command[0] == 'C_CALL') & set(self.calls)
+
+
+def count_functions(files):
+    return sum(1 for name, commands in files
+        for command in commands if command[0] == 'C_FUNCTION')
+
+def count_translated(files, **options):
+    '''Instructions the commands of files translate to, bootstrap and
+    shared routines aside
+    '''
+    cw = CodeWriter(None, **options)
+    for name, commands in files:
+        cw.set_file_name(name)
+        cw.write_commands(commands)
+    cw.flush() # Not close(), which would add the shared routines
+    return cw.line_count
+
+def translate_file(vm_file, **options):
+    '''Translate one file with fresh state; safe to run in a worker process.
+
+    vm_file is a filename, or a (name, commands) pair for commands already
+    in memory. Returns the arguments for CodeWriter.merge.
+    '''
+    if isinstance(vm_file, tuple):
+        name, commands = vm_file
+    else:
+        name, commands = vm_file, Parser(vm_file)
+    fw = FileWriter(**options)
+    fw.set_file_name(name)
+    fw.write_commands(commands)
+    fw.flush()
+    return fw.lines, fw.routines, fw.savings, fw.sources
+
+def translate_all(cw, vm_files, jobs=1):
+    '''Translate files across a process pool, merging into cw in input
+    order, so the output is the same for any number of jobs.
+    '''
+    options = {'comments': cw.comments, 'optimize': cw.peephole is not None,
+        'shared_calls': cw.shared_calls, 'shared_compare': cw.shared_compare,
+        'optimize_vm': cw.vm_optimizer is not None,
+        'cache_stack': cw.cache_stack, 'source_map': cw.source_map is not None}
+    translate = partial(translate_file, **options)
+    if jobs == 1 or len(vm_files) <= 1: # Not worth starting a pool
+        for vm_file in vm_files:
+            cw.merge(*translate(vm_file))
+        return
+    pool = Pool(jobs)
+    try:
+        for result in pool.imap(translate, vm_files):
+            cw.merge(*result)
+    finally:
+        pool.close()
+        pool.join()
+
+
 class Main(object):
-    def __init__(self, file_path):
+    '''Translate a .vm file, or a directory of them, to one .asm file.
+
+    Set strip=True to leave out functions that can't be called from
+    Sys.init; they are kept in self.dead_files for report_dead_code.
+    Files are translated in jobs worker processes (None for one per core)
+    and written in order of name. Set source_map=True to also write X.map
+    beside X.asm.
+    '''
+    def __init__(self, file_path, comments=True, optimize=False,
+            shared_calls=False, shared_compare=False, optimize_vm=False,
+            cache_stack=False, strip=False, jobs=1, source_map=False):
         self.parse_files(file_path)
-        self.cw = CodeWriter(self.asm_file)
+        self.options = {'comments': comments, 'optimize': optimize,
+            'shared_calls': shared_calls, 'shared_compare': shared_compare,
+            'optimize_vm': optimize_vm, 'cache_stack': cache_stack}
+        self.cw = CodeWriter(self.asm_file, source_map=source_map, **self.options)
         self.cw.write_init()
-        for vm_file in self.vm_files:
-            self.translate(vm_file)
+        files = self.vm_files
+        self.dead_files = []
+        if strip:
+            files = [(vm_file, list(Parser(vm_file))) for vm_file in files]
+            files, self.dead_files = CallGraph(files).split(files)
+        translate_all(self.cw, files, jobs)
         self.cw.close()
+        if source_map:
+            self.cw.write_source_map(self.asm_file.replace('.asm', '.map'))
+
+    def report_dead_code(self):
+        print(format_dead_code(self.dead_files, self.options))
+
+    def report_savings(self):
+        '''Instructions removed by the peephole optimizer, per file'''
+        total_before = total_after = 0
+        for vm_file, (before, after) in sorted(self.cw.savings.items()):
+            print(format_savings(vm_file, before, after))
+            total_before += before
+            total_after += after
+        print(format_savings('Total', total_before, total_after))
 
     def parse_files(self, file_path):
         if '.vm' in file_path:
@@ -397,38 +1399,57 @@ class Main(object):
             path = '/'.join(path_elements)
             self.asm_file = path + '/' + path_elements[-1] + '.asm'
             dirpath, dirnames, filenames = next(os.walk(file_path), [[],[],[]])
-            vm_files = filter(lambda x: '.vm' in x, filenames)
+            vm_files = sorted(filter(lambda x: '.vm' in x, filenames))
             self.vm_files = [path + '/' +  vm_file for vm_file in vm_files]
 
-    def translate(self, vm_file):
-        parser = Parser(vm_file)
-        self.cw.set_file_name(vm_file)
-        while parser.has_more_commands:
-            parser.advance()
-            self.cw.write('// ' + ' '.join(parser.curr_instruction), code=False)
-            if parser.command_type == 'C_PUSH':
-                self.cw.write_push_pop('C_PUSH', parser.arg1, int(parser.arg2))
-            elif parser.command_type == 'C_POP':
-                self.cw.write_push_pop('C_POP', parser.arg1, int(parser.arg2))
-            elif parser.command_type == 'C_ARITHMETIC':
-                self.cw.write_arithmetic(parser.arg1)
-            elif parser.command_type == 'C_LABEL':
-                self.cw.write_label(parser.arg1)
-            elif parser.command_type == 'C_GOTO':
-                self.cw.write_goto(parser.arg1)
-            elif parser.command_type == 'C_IF':
-                self.cw.write_if(parser.arg1)
-            elif parser.command_type == 'C_FUNCTION':
-                self.cw.write_function(parser.arg1, int(parser.arg2))
-            elif parser.command_type == 'C_CALL':
-                self.cw.write_call(parser.arg1, int(parser.arg2))
-            elif parser.command_type == 'C_RETURN':
-                self.cw.write_return()
-        parser.close()
+
+def format_savings(name, before, after):
+    saved = before - after
+    percent = 100.0 * saved / before if before else 0.0
+    return '{}: {} -> {} instructions ({} saved, {:.1f}%)'.format(
+        name, before, after, saved, percent)
+
+def format_dead_code(dead_files, options):
+    return 'Removed {} unreachable functions, {} instructions'.format(
+        count_functions(dead_files), count_translated(dead_files, **options))
 
 
 if __name__ == '__main__':
-    import sys
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(description='VM Translator')
+    arg_parser.add_argument('file_path', help='.vm file or directory of .vm files')
+    arg_parser.add_argument('--release', action='store_true',
+        help='omit VM source and ROM address comments from the output')
+    arg_parser.add_argument('--optimize', action='store_true',
+        help='run the peephole optimizer and report savings per file')
+    arg_parser.add_argument('--optimize-vm', action='store_true',
+        help='fold constants and fuse VM commands before translating them')
+    arg_parser.add_argument('--cache-stack', action='store_true',
+        help='keep the top of the stack in D and R14/R15 between commands')
+    arg_parser.add_argument('--shared-calls', action='store_true',
+        help='share one call and one return routine between all call sites')
+    arg_parser.add_argument('--shared-compare', action='store_true',
+        help='share one routine per comparison operator between all uses')
+    arg_parser.add_argument('--strip', action='store_true',
+        help='leave out functions Sys.init never calls, and report them')
+    arg_parser.add_argument('--stats', action='store_true',
+        help='report the ROM size and label count of the output')
+    arg_parser.add_argument('-j', '--jobs', type=int, default=1,
+        help='worker processes, 0 for one per core (default: 1)')
+    arg_parser.add_argument('--map', action='store_true',
+        help='also write X.map, the VM command behind each ROM address')
+    args = arg_parser.parse_args()
 
-    file_path = sys.argv[1]
-    Main(file_path)
\ No newline at end of file
+    main = Main(args.file_path, comments=not args.release,
+        optimize=args.optimize, shared_calls=args.shared_calls,
+        shared_compare=args.shared_compare, optimize_vm=args.optimize_vm,
+        cache_stack=args.cache_stack, strip=args.strip,
+        jobs=args.jobs or None, source_map=args.map)
+    if args.optimize:
+        main.report_savings()
+    if args.strip:
+        main.report_dead_code()
+    if args.stats:
+        print('{}: {} instructions, {} labels'.format(
+            main.asm_file, main.cw.line_count, main.cw.label_count))
\ No newline at end of file
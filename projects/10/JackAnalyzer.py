@@ -6,14 +6,33 @@ kronovet@gmail.com
 '''
 
 import os
-from collections import deque
+import re
+
+# One alternative per token kind; the first that matches at a position wins
+TOKEN = re.compile(r'''
+    (?P<space>\s+)
+  | (?P<comment>//[^\n]*|/\*.*?\*/)
+  | (?P<int>\d+)
+  | (?P<string>"[^"\n]*")
+  | (?P<word>[A-Za-z_]\w*)
+  | (?P<symbol>(?!/\*)[{}()\[\].,;+\-*/&|<>=~]) # An unclosed /* is an error
+  | (?P<error>.)
+''', re.VERBOSE | re.DOTALL)
 
 
 class JackAnalyzer(object):
-    def __init__(self, file_path):
+    '''Compiles each .jack file to a .vm file next to it.
+
+    With xml set, also writes the parse tree to MyX.xml (compare with
+    X.xml); with tokens set, writes the token list to MyXT.xml (compare
+    with XT.xml). Normal builds skip both.
+    '''
+    def __init__(self, file_path, xml=False, tokens=False):
         jack_files = self.parse_files(file_path)
         for jack_file in jack_files:
-            self.analyze(jack_file)
+            if tokens:
+                self.write_tokens(jack_file)
+            self.analyze(jack_file, xml)
 
     def parse_files(self, file_path):
         if '.jack' in file_path:
@@ -26,24 +45,29 @@ class JackAnalyzer(object):
             jack_files = filter(lambda x: '.jack' in x, filenames)
             return [file_path + '/' +  jack_file for jack_file in jack_files]
 
-    def analyze(self, jack_file):
+    def analyze(self, jack_file, xml=False):
         tokenizer = JackTokenizer(jack_file)
-        ce = CompilationEngine(jack_file)
-        while tokenizer.has_more_tokens():
-            tokenizer.advance()
-            if tokenizer.token_type == 'KEYWORD':
-
-                ce.write_token('keyword', tokenizer.curr_token)
-            elif tokenizer.token_type == 'SYMBOL':
-                ce.write_token('symbol', tokenizer.curr_token)
-            elif tokenizer.token_type == 'INT_CONSTANT':
-                ce.write_token('integerConstant', str(tokenizer.curr_token))
-            elif tokenizer.token_type == 'STRING_CONSTANT':
-                ce.write_token('stringConstant', tokenizer.curr_token)
-            elif tokenizer.token_type == 'IDENTIFIER':
-                ce.write_token('identifier', tokenizer.curr_token)
+        vm_writer = VMWriter(jack_file.replace('.jack', '.vm'))
+        xml_writer = XMLWriter(self.debug_filename(jack_file, '.xml')) if xml else None
+        ce = CompilationEngine(tokenizer, vm_writer, xml_writer)
+        ce.compile_class()
         ce.close()
 
+    def write_tokens(self, jack_file):
+        tokenizer = JackTokenizer(jack_file)
+        xml_writer = XMLWriter(self.debug_filename(jack_file, 'T.xml'))
+        xml_writer.open_tag('tokens')
+        for token_type, token, line, column in tokenizer.tokens():
+            xml_writer.write_token(token_type, token)
+        xml_writer.close_tag('tokens')
+        xml_writer.close()
+
+    def debug_filename(self, jack_file, suffix):
+        directory, filename = os.path.split(jack_file)
+        # Prefixed to avoid overwriting the supplied comparison files
+        return os.path.join(directory, 'My' + filename.replace('.jack', suffix))
+
+
 class JackTokenizer(object):
     #######
     ### API
@@ -52,67 +76,18 @@ class JackTokenizer(object):
         self.jack = self.load_file(self.jack_filename)
         self.curr_token = None
         self.token_type = None
+        self.line = None
+        self.column = None
         self.keywords = self.keyword_dict()
-        self.symbols = self.symbol_set()
+        self.stream = self.tokens()
+        self.next_token = next(self.stream, None)
 
     def has_more_tokens(self):
-        return self.jack
+        return self.next_token is not None
 
     def advance(self):
-        next_token = self.jack.popleft()
-
-        # Symbol
-        if next_token[0] in self.symbols:
-            self.token_type = 'SYMBOL'
-            if len(next_token) >= 2 and next_token[:2] in ['++', '<=', '>=']:
-                self.curr_token = next_token[:2]
-                if next_token[2:]:
-                    self.jack.appendleft(next_token[2:])
-            else:
-                self.curr_token = next_token[0]
-                if next_token[1:]:
-                    self.jack.appendleft(next_token[1:])
-            return
-
-        # String Constant
-        if next_token[0] == '"':
-            self.token_type = 'STRING_CONSTANT'
-            curr_string = next_token[1:]
-            full_string = ''
-            while True:
-                for i, el in enumerate(curr_string):
-                    if el == '"':
-                        full_string += curr_string[:i]
-                        if curr_string[i+1:]:
-                            self.jack.appendleft(curr_string[i+1:])
-                        self.curr_token = full_string.strip()
-                        return
-                full_string += curr_string + ' '
-                curr_string = self.jack.popleft()
-
-        # Integer Constant
-        if self.is_int(next_token[0]):
-            self.token_type = 'INT_CONSTANT'
-            int_idx = 0
-            while self.is_int(next_token[:int_idx+1]):
-                int_idx += 1
-            self.curr_token = next_token[:int_idx]
-            if next_token[int_idx:]:
-                self.jack.appendleft(next_token[int_idx:])
-            return
-
-        # Identifier or Keyword
-        # Need to check for trailing symbol
-        self.curr_token = next_token
-        for i, el in enumerate(next_token):
-            if el in self.symbols:
-                self.curr_token = next_token[:i]
-                self.jack.appendleft(next_token[i:])
-                break
-        if self.curr_token in self.keywords:
-            self.token_type = 'KEYWORD'
-        else:
-            self.token_type = 'IDENTIFIER'
+        self.token_type, self.curr_token, self.line, self.column = self.next_token
+        self.next_token = next(self.stream, None)
 
     def token_type(self):
         return self.token_type
@@ -135,35 +110,42 @@ class JackTokenizer(object):
     ### END API
     ###########
 
+    def tokens(self):
+        '''Yield (token type, token, line, column) in one pass over the file'''
+        jack = self.jack
+        keywords = self.keywords
+        line, line_start = 1, 0
+        for match in TOKEN.finditer(jack):
+            kind = match.lastgroup
+            start = match.start()
+            if kind == 'word':
+                token = match.group()
+                yield ('KEYWORD' if token in keywords else 'IDENTIFIER',
+                    token, line, start - line_start + 1)
+            elif kind == 'symbol':
+                yield 'SYMBOL', match.group(), line, start - line_start + 1
+            elif kind == 'int':
+                token = match.group()
+                if int(token) > 32767:
+                    raise ValueError(self.error('{} is too large'.format(token), line, start - line_start))
+                yield 'INT_CONSTANT', token, line, start - line_start + 1
+            elif kind == 'string':
+                yield 'STRING_CONSTANT', match.group()[1:-1], line, start - line_start + 1
+            elif kind == 'error':
+                raise ValueError(self.error('unexpected {!r}'.format(match.group()),
+                    line, start - line_start))
+            else: # Whitespace and comments; only they span lines
+                newlines = jack.count('\n', start, match.end())
+                if newlines:
+                    line += newlines
+                    line_start = jack.rindex('\n', start, match.end()) + 1
+
+    def error(self, message, line, column):
+        return '{}:{}:{}: {}'.format(self.jack_filename, line, column + 1, message)
+
     def load_file(self, jack_filename):
-        with open(jack_filename, 'r') as f:
-            contents = f.read()
-        contents = contents.split('\n')
-        contents = [l.strip() for l in contents]
-        contents = [l.split('//')[0] for l in contents]
-        in_comment = False
-        for i, line in enumerate(contents):
-            start, end = line[:2], line[-2:]
-            if start == '/*':
-                in_comment = True
-
-            if in_comment:
-                contents[i] = ''
-
-            if start == '*/' or end == '*/':
-                in_comment = False
-        words = []
-        for line in contents:
-            words.extend(line.split())
-        words = [l for l in words if l]
-        return deque(words)
-
-    def is_int(self, string):
-        try:
-            int(string)
-            return True
-        except ValueError:
-            return False
+        with open(jack_filename, 'rb') as f: # OS sources have cp1252 bytes in comments
+            return f.read().decode('latin-1')
 
     def keyword_dict(self):
         return {
@@ -190,103 +172,524 @@ class JackTokenizer(object):
             'return': 'RETURN'
         }
 
-    def symbol_set(self):
-        return set([
-            '{',
-            '}',
-            '(',
-            ')',
-            '[',
-            ']',
-            '.',
-            ',',
-            ';',
-            '+',
-            '-',
-            '*',
-            '/',
-            '&',
-            '|',
-            '<',
-            '>',
-            '=',
-            '~',
-        ])
-
-
 
 class CompilationEngine(object):
+    '''Recursive-descent compiler from one class's tokens to VM code'''
     #######
     ### API
-    def __init__(self, jack_filename):
-        filename_pieces = jack_filename.split('/')
-        filename_pieces[-1] = 'My' + filename_pieces[-1] # Avoid overwriting original file
-        xml_filename = '/'.join(filename_pieces).replace('.jack', '.xml')
-        self.xml = open(xml_filename, 'w')
-        self.indent = 0
-        self.write('<tokens>\n')
-        self.updent()
+    def __init__(self, tokenizer, vm_writer, xml_writer=None):
+        self.jack_filename = tokenizer.jack_filename
+        self.tokens = list(tokenizer.tokens())
+        self.position = 0
+        self.vm = vm_writer
+        self.xml = xml_writer
+        self.symbols = SymbolTable()
+        self.class_name = None
+        self.label_counts = {}
 
     def compile_class(self):
-
-        pass
+        self.open_tag('class')
+        self.expect('class')
+        self.class_name = self.expect_identifier()
+        self.expect('{')
+        while self.peek() in ('static', 'field'):
+            self.compile_class_var_dec()
+        while self.peek() in ('constructor', 'function', 'method'):
+            self.compile_subroutine()
+        self.expect('}')
+        self.close_tag('class')
+        if self.position < len(self.tokens):
+            raise self.error('expected end of file')
 
     def compile_class_var_dec(self):
-        pass
+        self.open_tag('classVarDec')
+        kind = self.advance().upper()
+        self.compile_declarations(kind)
+        self.close_tag('classVarDec')
 
     def compile_subroutine(self):
-        pass
+        self.open_tag('subroutineDec')
+        subroutine_type = self.advance()
+        self.advance() # Return type
+        name = self.expect_identifier()
+        self.symbols.start_subroutine()
+        if subroutine_type == 'method':
+            self.symbols.define('this', self.class_name, 'ARG')
+        self.expect('(')
+        self.compile_parameter_list()
+        self.expect(')')
+
+        self.open_tag('subroutineBody')
+        self.expect('{')
+        while self.peek() == 'var':
+            self.compile_var_dec()
+        self.vm.write_function('{}.{}'.format(self.class_name, name),
+            self.symbols.var_count('VAR'))
+        if subroutine_type == 'constructor':
+            self.vm.write_push('constant', self.symbols.var_count('FIELD'))
+            self.vm.write_call('Memory.alloc', 1)
+            self.vm.write_pop('pointer', 0)
+        elif subroutine_type == 'method':
+            self.vm.write_push('argument', 0)
+            self.vm.write_pop('pointer', 0)
+        self.compile_statements()
+        self.expect('}')
+        self.close_tag('subroutineBody')
+        self.close_tag('subroutineDec')
 
     def compile_parameter_list(self):
-        pass
+        self.open_tag('parameterList')
+        if self.peek() != ')':
+            while True:
+                var_type = self.expect_type()
+                self.symbols.define(self.expect_identifier(), var_type, 'ARG')
+                if self.peek() != ',':
+                    break
+                self.advance()
+        self.close_tag('parameterList')
 
     def compile_var_dec(self):
-        pass
+        self.open_tag('varDec')
+        self.advance() # var
+        self.compile_declarations('VAR')
+        self.close_tag('varDec')
 
     def compile_statements(self):
-        pass
+        self.open_tag('statements')
+        while True:
+            statement = self.peek()
+            if statement == 'let':
+                self.compile_let()
+            elif statement == 'if':
+                self.compile_if()
+            elif statement == 'while':
+                self.compile_while()
+            elif statement == 'do':
+                self.compile_do()
+            elif statement == 'return':
+                self.compile_return()
+            else:
+                break
+        self.close_tag('statements')
 
     def compile_do(self):
-        pass
+        self.open_tag('doStatement')
+        self.advance() # do
+        self.compile_subroutine_call(self.expect_identifier())
+        self.vm.write_pop('temp', 0) # Discard the return value
+        self.expect(';')
+        self.close_tag('doStatement')
 
     def compile_let(self):
-        pass
+        self.open_tag('letStatement')
+        self.advance() # let
+        name = self.expect_identifier()
+        segment, index = self.variable(name)
+        if self.peek() == '[':
+            self.advance()
+            self.vm.write_push(segment, index)
+            self.compile_expression()
+            self.vm.write_arithmetic('add')
+            self.expect(']')
+            self.expect('=')
+            self.compile_expression()
+            self.vm.write_pop('temp', 0) # The value, while the address goes to THAT
+            self.vm.write_pop('pointer', 1)
+            self.vm.write_push('temp', 0)
+            self.vm.write_pop('that', 0)
+        else:
+            self.expect('=')
+            self.compile_expression()
+            self.vm.write_pop(segment, index)
+        self.expect(';')
+        self.close_tag('letStatement')
 
     def compile_while(self):
-        pass
+        self.open_tag('whileStatement')
+        top, end = self.labels('WHILE_EXP', 'WHILE_END')
+        self.advance() # while
+        self.vm.write_label(top)
+        self.expect('(')
+        self.compile_expression()
+        self.expect(')')
+        self.vm.write_arithmetic('not')
+        self.vm.write_if(end)
+        self.expect('{')
+        self.compile_statements()
+        self.expect('}')
+        self.vm.write_goto(top)
+        self.vm.write_label(end)
+        self.close_tag('whileStatement')
 
     def compile_return(self):
-        pass
+        self.open_tag('returnStatement')
+        self.advance() # return
+        if self.peek() == ';':
+            self.vm.write_push('constant', 0) # void
+        else:
+            self.compile_expression()
+        self.vm.write_return()
+        self.expect(';')
+        self.close_tag('returnStatement')
 
     def compile_if(self):
-        pass
+        self.open_tag('ifStatement')
+        false, end = self.labels('IF_FALSE', 'IF_END')
+        self.advance() # if
+        self.expect('(')
+        self.compile_expression()
+        self.expect(')')
+        self.vm.write_arithmetic('not')
+        self.vm.write_if(false)
+        self.expect('{')
+        self.compile_statements()
+        self.expect('}')
+        if self.peek() == 'else':
+            self.vm.write_goto(end)
+            self.vm.write_label(false)
+            self.advance()
+            self.expect('{')
+            self.compile_statements()
+            self.expect('}')
+            self.vm.write_label(end)
+        else:
+            self.vm.write_label(false)
+        self.close_tag('ifStatement')
 
     def compile_expression(self):
-        pass
+        self.open_tag('expression')
+        self.compile_term()
+        operators = self.operator_dict()
+        while self.peek() in operators:
+            operator = self.advance()
+            self.compile_term()
+            if operator in ('*', '/'):
+                self.vm.write_call(operators[operator], 2)
+            else:
+                self.vm.write_arithmetic(operators[operator])
+        self.close_tag('expression')
 
     def compile_term(self):
-        pass
+        self.open_tag('term')
+        token_type, token = self.peek_token()[:2]
+        if token_type == 'INT_CONSTANT':
+            self.advance()
+            self.vm.write_push('constant', int(token))
+        elif token_type == 'STRING_CONSTANT':
+            self.advance()
+            self.vm.write_push('constant', len(token))
+            self.vm.write_call('String.new', 1)
+            for char in token:
+                self.vm.write_push('constant', ord(char))
+                self.vm.write_call('String.appendChar', 2)
+        elif token in ('true', 'false', 'null', 'this') and token_type == 'KEYWORD':
+            self.advance()
+            if token == 'this':
+                self.vm.write_push('pointer', 0)
+            else:
+                self.vm.write_push('constant', 0)
+                if token == 'true':
+                    self.vm.write_arithmetic('not')
+        elif token == '(':
+            self.advance()
+            self.compile_expression()
+            self.expect(')')
+        elif token in ('-', '~'):
+            self.advance()
+            self.compile_term()
+            self.vm.write_arithmetic('neg' if token == '-' else 'not')
+        elif token_type == 'IDENTIFIER':
+            name = self.advance()
+            following = self.peek()
+            if following in ('(', '.'):
+                self.compile_subroutine_call(name)
+            elif following == '[':
+                self.advance()
+                self.vm.write_push(*self.variable(name))
+                self.compile_expression()
+                self.expect(']')
+                self.vm.write_arithmetic('add')
+                self.vm.write_pop('pointer', 1)
+                self.vm.write_push('that', 0)
+            else:
+                self.vm.write_push(*self.variable(name))
+        else:
+            raise self.error('expected a term, got {!r}'.format(token))
+        self.close_tag('term')
 
     def compile_expression_list(self):
-        pass
+        '''Return the number of expressions compiled'''
+        self.open_tag('expressionList')
+        count = 0
+        if self.peek() != ')':
+            self.compile_expression()
+            count += 1
+            while self.peek() == ',':
+                self.advance()
+                self.compile_expression()
+                count += 1
+        self.close_tag('expressionList')
+        return count
+
+    ### END API
+    ###########
+
+    def compile_subroutine_call(self, name):
+        '''name(...), ClassName.name(...) or variable.name(...); name is consumed'''
+        args = 0
+        if self.peek() == '.':
+            self.advance()
+            subroutine = self.expect_identifier()
+            if self.symbols.kind_of(name) is not None: # Method call on an object
+                self.vm.write_push(*self.variable(name))
+                name = self.symbols.type_of(name)
+                args = 1
+            name = '{}.{}'.format(name, subroutine)
+        else: # Method call on this
+            self.vm.write_push('pointer', 0)
+            name = '{}.{}'.format(self.class_name, name)
+            args = 1
+        self.expect('(')
+        args += self.compile_expression_list()
+        self.expect(')')
+        self.vm.write_call(name, args)
+
+    def compile_declarations(self, kind):
+        '''type name (, name)* ;'''
+        var_type = self.expect_type()
+        while True:
+            self.symbols.define(self.expect_identifier(), var_type, kind)
+            if self.peek() != ',':
+                break
+            self.advance()
+        self.expect(';')
+
+    def variable(self, name):
+        '''(segment, index) for a variable in scope'''
+        kind = self.symbols.kind_of(name)
+        if kind is None:
+            raise self.error('{} is not defined'.format(name), self.position - 1)
+        return self.segment_dict()[kind], self.symbols.index_of(name)
+
+    def labels(self, *prefixes):
+        '''Fresh labels, numbered per class since VMtranslator scopes labels by file'''
+        labels = []
+        for prefix in prefixes:
+            count = self.label_counts.get(prefix, 0)
+            self.label_counts[prefix] = count + 1
+            labels.append('{}{}'.format(prefix, count))
+        return labels
+
+    def peek_token(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return None, None, None, None
+
+    def peek(self):
+        return self.peek_token()[1]
+
+    def advance(self):
+        if self.position >= len(self.tokens):
+            raise self.error('unexpected end of file')
+        token_type, token, line, column = self.tokens[self.position]
+        self.position += 1
+        if self.xml:
+            self.xml.write_token(token_type, token)
+        return token
+
+    def expect(self, expected):
+        if self.peek() != expected:
+            raise self.error('expected {!r}, got {!r}'.format(expected, self.peek()))
+        return self.advance()
+
+    def expect_identifier(self):
+        if self.peek_token()[0] != 'IDENTIFIER':
+            raise self.error('expected an identifier, got {!r}'.format(self.peek()))
+        return self.advance()
+
+    def expect_type(self):
+        if self.peek() not in ('int', 'char', 'boolean') and self.peek_token()[0] != 'IDENTIFIER':
+            raise self.error('expected a type, got {!r}'.format(self.peek()))
+        return self.advance()
+
+    def error(self, message, position=None):
+        position = self.position if position is None else position
+        if position < len(self.tokens):
+            line, column = self.tokens[position][2:]
+        else:
+            line, column = 'EOF', 0
+        return ValueError('{}:{}:{}: {}'.format(self.jack_filename, line, column, message))
+
+    def open_tag(self, tag):
+        if self.xml:
+            self.xml.open_tag(tag)
+
+    def close_tag(self, tag):
+        if self.xml:
+            self.xml.close_tag(tag)
+
+    def close(self):
+        self.vm.close()
+        if self.xml:
+            self.xml.close()
+
+    def operator_dict(self):
+        return {
+            '+': 'add',
+            '-': 'sub',
+            '*': 'Math.multiply',
+            '/': 'Math.divide',
+            '&': 'and',
+            '|': 'or',
+            '<': 'lt',
+            '>': 'gt',
+            '=': 'eq',
+        }
+
+    def segment_dict(self):
+        return {
+            'STATIC': 'static',
+            'FIELD': 'this',
+            'ARG': 'argument',
+            'VAR': 'local',
+        }
+
+
+class SymbolTable(object):
+    #######
+    ### API
+    def __init__(self):
+        self.class_table = {}
+        self.subroutine_table = {}
+        self.counts = dict.fromkeys(['STATIC', 'FIELD', 'ARG', 'VAR'], 0)
+
+    def start_subroutine(self):
+        self.subroutine_table = {}
+        self.counts['ARG'] = 0
+        self.counts['VAR'] = 0
+
+    def define(self, name, var_type, kind):
+        table = self.class_table if kind in ('STATIC', 'FIELD') else self.subroutine_table
+        table[name] = (var_type, kind, self.counts[kind])
+        self.counts[kind] += 1
+
+    def var_count(self, kind):
+        return self.counts[kind]
+
+    def kind_of(self, name):
+        entry = self.lookup(name)
+        return entry and entry[1]
+
+    def type_of(self, name):
+        return self.lookup(name)[0]
+
+    def index_of(self, name):
+        return self.lookup(name)[2]
+
+    ### END API
+    ###########
+
+    def lookup(self, name):
+        return self.subroutine_table.get(name) or self.class_table.get(name)
+
+
+class VMWriter(object):
+    '''Records VM commands and writes the .vm file on close.
+
+    Commands are kept as the (command_type, arg1, arg2) tuples that
+    VMtranslator's Parser yields, so a build can hand them straight to
+    CodeWriter.write_commands. With no vm_filename nothing is written.
+    '''
+    #######
+    ### API
+    def __init__(self, vm_filename=None):
+        self.vm_filename = vm_filename
+        self.commands = []
+        self.keywords = self.keyword_dict()
+
+    def write_push(self, segment, index):
+        self.commands.append(('C_PUSH', segment, index))
+
+    def write_pop(self, segment, index):
+        self.commands.append(('C_POP', segment, index))
+
+    def write_arithmetic(self, command):
+        self.commands.append(('C_ARITHMETIC', command, None))
+
+    def write_label(self, label):
+        self.commands.append(('C_LABEL', label, None))
+
+    def write_goto(self, label):
+        self.commands.append(('C_GOTO', label, None))
+
+    def write_if(self, label):
+        self.commands.append(('C_IF', label, None))
+
+    def write_call(self, name, n_args):
+        self.commands.append(('C_CALL', name, n_args))
+
+    def write_function(self, name, n_locals):
+        self.commands.append(('C_FUNCTION', name, n_locals))
+
+    def write_return(self):
+        self.commands.append(('C_RETURN', None, None))
+
+    def close(self):
+        if self.vm_filename is None:
+            return
+        with open(self.vm_filename, 'w') as f:
+            f.write(''.join([self.format(*command) + '\n' for command in self.commands]))
 
     ### END API
     ###########
 
+    def format(self, command_type, arg1, arg2):
+        if command_type == 'C_ARITHMETIC':
+            return arg1
+        args = [str(arg) for arg in (arg1, arg2) if arg is not None]
+        return ' '.join([self.keywords[command_type]] + args)
+
+    def keyword_dict(self):
+        return {
+           'C_PUSH': 'push',
+            'C_POP': 'pop',
+          'C_LABEL': 'label',
+           'C_GOTO': 'goto',
+             'C_IF': 'if-goto',
+       'C_FUNCTION': 'function',
+         'C_RETURN': 'return',
+           'C_CALL': 'call',
+        }
+
+
+class XMLWriter(object):
+    '''Debug output: tokens or the parse tree, in the course's XML format'''
+    def __init__(self, xml_filename):
+        self.xml = open(xml_filename, 'w')
+        self.indent = 0
+        self.tags = self.tag_dict()
+
     def write(self, content):
         self.xml.write(content)
 
     def write_token(self, token_type, token):
+        tag = self.tags[token_type]
         token = token.replace('&', '&amp;')
         token = token.replace('<', '&lt;')
         token = token.replace('>', '&gt;')
-        self.write(' ' * self.indent + '<' + token_type.lower() + '> ')
+        self.write(' ' * self.indent + '<' + tag + '> ')
         self.write(token)
-        self.write(' </' + token_type.lower() + '>\n')
+        self.write(' </' + tag + '>\n')
 
-    def close(self):
+    def open_tag(self, tag):
+        self.write(' ' * self.indent + '<' + tag + '>\n')
+        self.updent()
+
+    def close_tag(self, tag):
         self.downdent()
-        self.write('</tokens>')
+        self.write(' ' * self.indent + '</' + tag + '>\n')
+
+    def close(self):
         self.xml.close()
 
     def updent(self):
@@ -295,9 +698,25 @@ class CompilationEngine(object):
     def downdent(self):
         self.indent -= 2
 
+    def tag_dict(self):
+        return {
+            'KEYWORD': 'keyword',
+            'SYMBOL': 'symbol',
+            'INT_CONSTANT': 'integerConstant',
+            'STRING_CONSTANT': 'stringConstant',
+            'IDENTIFIER': 'identifier',
+        }
+
 
 if __name__ == '__main__':
-    import sys
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(description='Jack Compiler')
+    arg_parser.add_argument('file_path', help='.jack file or directory of .jack files')
+    arg_parser.add_argument('--xml', action='store_true',
+        help='also write the parse tree to MyX.xml')
+    arg_parser.add_argument('--tokens', action='store_true',
+        help='also write the token list to MyXT.xml')
+    args = arg_parser.parse_args()
 
-    file_path = sys.argv[1]
-    JackAnalyzer(file_path)
\ No newline at end of file
+    JackAnalyzer(args.file_path, xml=args.xml, tokens=args.tokens)
@@ -1,39 +1,13 @@
-assemble=false
+# Usage: ./test.sh PROJECT [SUBDIRECTORY] [testrunner.py options]
+# e.g. ./test.sh 03 a, or ./test.sh 05 --keyboard --junit report.xml
 
-if [ $1 -le 3 ]
-then
-  cmd="tools/HardwareSimulator.sh"
-elif [ $1 -eq 4 ]
-then
-  cmd="tools/CPUEmulator.sh"
-  assemble=true
-elif [ $1 -eq 5 ]
-then
-  cmd="tools/HardwareSimulator.sh"
-else
-  echo "Unknown project"
-fi
-
-if [ $2 ]
+if [ $2 ] && [ "${2#-}" = "$2" ]
 then
   path=$1/$2
+  shift 2
 else
   path=$1
+  shift
 fi
 
-if [ $assemble ]
-then
-  for file in projects/$path/*.asm
-  do
-    echo
-    echo "Assembling $file"
-    tools/Assembler.sh $file
-  done
-fi
-
-for file in projects/$path/*.tst
-do
-  echo
-  echo "Testing $file"
-  $cmd $file
-done
\ No newline at end of file
+python "$(dirname "$0")/testrunner.py" projects/$path "$@"
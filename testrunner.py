@@ -0,0 +1,456 @@
+#!/usr/bin/env python
+'''
+Test Runner
+
+Runs the .tst scripts from the projects and compares their output with
+the .cmp files, in place of test.sh starting the Java HardwareSimulator
+or CPUEmulator once per file. Hardware scripts (load X.hdl) run on the
+NumPy simulator in hdl.py; CPU emulator scripts (load X.hack or X.asm)
+run on the emulator from projects/06. Independent scripts run across a
+process pool, and results can be written as a JUnit XML report.
+
+Scripts that need a person at the keyboard (a while loop waiting on the
+Keyboard chip, or a repeat with no count) are skipped. With --keyboard,
+a loop waiting for a key gets that key pressed for it instead.
+'''
+
+from __future__ import print_function
+
+import os
+import re
+import sys
+import time
+from multiprocessing import Pool
+from functools import partial
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(ROOT, 'projects', '06'))
+
+import hdl
+import rom
+from emulator import Emulator, load_program
+
+TOKENS = re.compile(r'//[^\n]*|/\*.*?\*/|("[^"]*"|[{},;!]|[^\s{},;!]+)', re.DOTALL)
+COLUMN = re.compile(r'^(.+)%([BDSX])(\d+)\.(\d+)\.(\d+)$')
+CLOCK_COMMANDS = ('tick', 'tock', 'ticktock')
+
+
+class Failure(Exception):
+    '''Output differed from the .cmp file'''
+
+
+class Skipped(Exception):
+    '''The script can't run unattended'''
+
+
+def parse_value(text):
+    '''"%X2000", "%B0101", "%D-1" or "-1" -> int'''
+    if text.startswith('%X'):
+        return int(text[2:], 16)
+    if text.startswith('%B'):
+        return int(text[2:], 2)
+    if text.startswith('%D'):
+        return int(text[2:])
+    return int(text)
+
+
+def signed(value, width):
+    if width == 16 and value & 0x8000:
+        return value - 0x10000
+    return value
+
+
+class Script(object):
+    '''Parses a .tst file into (command, arguments, body) tuples'''
+    def __init__(self, tst_filename):
+        with open(tst_filename) as f:
+            self.tokens = [t for t in TOKENS.findall(f.read()) if t]
+        self.position = 0
+
+    def parse(self):
+        commands = []
+        statement = []
+        while self.position < len(self.tokens):
+            token = self.tokens[self.position]
+            self.position += 1
+            if token in (',', ';', '!'):
+                if statement:
+                    commands.append((statement[0], statement[1:], None))
+                statement = []
+            elif token == '{':
+                commands.append((statement[0], statement[1:], self.parse()))
+                statement = []
+            elif token == '}':
+                break
+            else:
+                statement.append(token)
+        if statement:
+            commands.append((statement[0], statement[1:], None))
+        return commands
+
+
+class Hardware(object):
+    '''A chip from an .hdl file, as seen by a test script'''
+    def __init__(self, hdl_filename):
+        self.simulator = hdl.Simulator(hdl.load_chip(hdl_filename))
+        self.inputs = dict(self.simulator.netlist.chip.inputs)
+        self.outputs = dict(self.simulator.netlist.chip.outputs)
+
+    def part(self, name):
+        '''"RAM16K[3]" -> ("RAM16K", 3); "PC[]" -> ("PC", 0)'''
+        part, _, index = name.rstrip(']').partition('[')
+        return part, int(index or 0)
+
+    def get(self, name):
+        '''Return (value, width)'''
+        if name in self.inputs:
+            return int(self.simulator.inputs[name][0]), self.inputs[name]
+        if name in self.outputs:
+            return int(self.simulator.output(name)[0]), self.outputs[name]
+        if '[' in name:
+            return self.simulator.peek(*self.part(name)), 16
+        raise ValueError('{} is not a pin'.format(name))
+
+    def set(self, name, value):
+        if name in self.inputs:
+            self.simulator.set(name, value & hdl.mask(self.inputs[name]))
+        elif '[' in name:
+            part, index = self.part(name)
+            self.simulator.poke(part, index, value & 0xFFFF)
+        else:
+            raise ValueError('{} is not an input pin'.format(name))
+
+    def eval(self):
+        self.simulator.eval()
+
+    def tick(self):
+        self.simulator.tick()
+
+    def tock(self):
+        self.simulator.tock()
+
+    def press(self, key):
+        '''Hold key down on the Keyboard; False if there is no Keyboard'''
+        try:
+            self.simulator.poke('Keyboard', 0, key)
+        except ValueError:
+            return False
+        self.simulator.eval()
+        return True
+
+    def chip_command(self, name, arguments, directory):
+        if name == 'ROM32K' and arguments[:1] == ['load']:
+            self.simulator.load_rom(rom.read_hack(os.path.join(directory, arguments[1])))
+        else:
+            raise ValueError('{} {} is not supported'.format(name, ' '.join(arguments)))
+
+
+class CPU(object):
+    '''A Hack program on the emulator, as seen by a test script'''
+    def __init__(self, program_filename):
+        if not os.path.exists(program_filename) and program_filename.endswith('.hack'):
+            program_filename = program_filename[:-len('.hack')] + '.asm'
+        self.emulator = Emulator(load_program(program_filename))
+
+    def get(self, name):
+        emulator = self.emulator
+        if name.startswith('RAM['):
+            return emulator.ram[int(name[4:-1])] & 0xFFFF, 16
+        if name == 'PC':
+            return emulator.pc, 15
+        if name in ('A', 'D'):
+            return getattr(emulator, name.lower()) & 0xFFFF, 16
+        raise ValueError('{} is not a CPU emulator variable'.format(name))
+
+    def set(self, name, value):
+        emulator = self.emulator
+        if name.startswith('RAM['):
+            emulator.ram[int(name[4:-1])] = signed(value & 0xFFFF, 16)
+        elif name == 'PC':
+            emulator.pc = value
+            emulator.halted = False
+        elif name in ('A', 'D'):
+            setattr(emulator, name.lower(), signed(value & 0xFFFF, 16))
+        else:
+            raise ValueError('{} is not a CPU emulator variable'.format(name))
+
+    def ticktock(self, cycles=1):
+        self.emulator.run(cycles)
+
+    def press(self, key):
+        self.emulator.ram[24576] = key
+        return True
+
+
+class TestScript(object):
+    '''Runs one .tst script and checks its output against the .cmp file'''
+    def __init__(self, tst_filename, keyboard=False):
+        self.tst_filename = tst_filename
+        self.directory = os.path.dirname(tst_filename)
+        self.keyboard = keyboard
+        self.machine = None
+        self.columns = []
+        self.out_lines = []
+        self.out_filename = None
+        self.cmp_lines = None
+        self.clock = 0
+        self.time = '0'
+
+    def run(self):
+        try:
+            self.execute(Script(self.tst_filename).parse())
+        except Failure:
+            self.write_out()
+            raise
+        self.write_out()
+
+    def write_out(self):
+        if self.out_filename:
+            with open(self.out_filename, 'w') as f:
+                f.write(''.join(line + '\n' for line in self.out_lines))
+
+    def execute(self, commands):
+        for name, arguments, body in commands:
+            if name == 'repeat':
+                if not arguments:
+                    raise Skipped('repeat with no count runs until stopped by hand')
+                self.repeat(int(arguments[0]), body)
+            elif name == 'while':
+                self.loop(arguments, body)
+            else:
+                self.command(name, arguments)
+
+    def repeat(self, count, body):
+        if [command[0] for command in body] == ['ticktock'] and hasattr(self.machine, 'ticktock'):
+            self.machine.ticktock(count) # Let the emulator run the whole stretch
+            self.clock += count
+            self.time = str(self.clock)
+            return
+        for i in range(count):
+            self.execute(body)
+
+    def loop(self, condition, body):
+        clocked = any(command[0] in CLOCK_COMMANDS for command in body)
+        while self.holds(condition):
+            self.execute(body)
+            if not clocked and self.holds(condition):
+                # Nothing in the loop can change the outcome; it's waiting for a person
+                self.press_key(condition)
+
+    def press_key(self, condition):
+        '''Press the key that ends a loop like: while out <> 75 { eval }'''
+        if not self.keyboard:
+            raise Skipped('waits for keyboard input (see --keyboard)')
+        name, operator, operand = condition
+        key = {'<>': parse_value(operand), '=': 0}.get(operator)
+        if key is None or not self.machine.press(key) or self.holds(condition):
+            raise Skipped('waits for input that can\'t be simulated')
+
+    def holds(self, condition):
+        name, operator, operand = condition
+        value = signed(*self.machine.get(name))
+        operand = parse_value(operand)
+        return {
+            '=': value == operand,
+            '<>': value != operand,
+            '<': value < operand,
+            '>': value > operand,
+            '<=': value <= operand,
+            '>=': value >= operand,
+        }[operator]
+
+    def command(self, name, arguments):
+        if name == 'load':
+            self.load(os.path.join(self.directory, arguments[0]) if arguments else '')
+        elif name == 'output-file':
+            self.out_filename = os.path.join(self.directory, arguments[0])
+        elif name == 'compare-to':
+            with open(os.path.join(self.directory, arguments[0])) as f:
+                self.cmp_lines = [line.rstrip('\r\n') for line in f if line.strip()]
+        elif name == 'output-list':
+            self.columns = [self.column(argument) for argument in arguments]
+            self.write_line(self.header())
+        elif name == 'output':
+            self.write_line(self.values())
+        elif name == 'set':
+            self.machine.set(arguments[0], parse_value(arguments[1]))
+        elif name == 'eval':
+            self.machine.eval()
+        elif name == 'tick':
+            self.machine.tick()
+            self.time = '{}+'.format(self.clock)
+        elif name == 'tock':
+            self.machine.tock()
+            self.clock += 1
+            self.time = str(self.clock)
+        elif name == 'ticktock':
+            self.machine.ticktock()
+            self.clock += 1
+            self.time = str(self.clock)
+        elif name in ('echo', 'clear-echo'):
+            pass
+        else:
+            self.machine.chip_command(name, arguments, self.directory)
+
+    def load(self, filename):
+        if filename.endswith('.hdl'):
+            self.machine = Hardware(filename)
+        elif filename.endswith('.hack') or filename.endswith('.asm'):
+            self.machine = CPU(filename)
+        else:
+            raise Skipped('only HardwareSimulator and CPUEmulator scripts are supported')
+
+    def column(self, spec):
+        match = COLUMN.match(spec)
+        if not match:
+            raise ValueError('{} is not an output-list column'.format(spec))
+        name, format, left, width, right = match.groups()
+        return name, format, int(left), int(width), int(right)
+
+    def header(self):
+        cells = []
+        for name, format, left, width, right in self.columns:
+            total = left + width + right
+            name = name[:total]
+            padding = (total - len(name)) // 2
+            cells.append(' ' * padding + name + ' ' * (total - len(name) - padding))
+        return '|' + '|'.join(cells) + '|'
+
+    def values(self):
+        cells = []
+        for name, format, left, width, right in self.columns:
+            if name == 'time':
+                text = self.time.ljust(width)
+            else:
+                value, bits = self.machine.get(name)
+                if format == 'B':
+                    text = '{:0{}b}'.format(value & hdl.mask(width), width)
+                elif format == 'X':
+                    text = '{:0{}X}'.format(value, width)
+                elif format == 'S':
+                    text = str(value).ljust(width)
+                else:
+                    text = str(signed(value, bits)).rjust(width)
+            cells.append(' ' * left + text[-width:] + ' ' * right)
+        return '|' + '|'.join(cells) + '|'
+
+    def write_line(self, line):
+        self.out_lines.append(line)
+        if self.cmp_lines is None:
+            return
+        number = len(self.out_lines)
+        if number > len(self.cmp_lines):
+            raise Failure('line {}: .cmp file ended, got {}'.format(number, line))
+        expected = self.cmp_lines[number - 1]
+        if not self.matches(line, expected):
+            raise Failure('line {}: expected {}, got {}'.format(number, expected.strip(), line))
+
+    def matches(self, line, expected):
+        '''Compare cell by cell; a cell of *s in the .cmp file matches anything'''
+        cells = [cell.strip() for cell in line.split('|')]
+        expected_cells = [cell.strip() for cell in expected.split('|')]
+        if len(cells) != len(expected_cells):
+            return False
+        return all(cell == wanted or (wanted and set(wanted) == set('*'))
+            for cell, wanted in zip(cells, expected_cells))
+
+
+def run_test(tst_filename, keyboard=False):
+    '''Run one script; safe to call in a worker process.
+
+    Returns (tst_filename, status, message, seconds) where status is one
+    of passed, failed, error or skipped.
+    '''
+    start = time.time()
+    try:
+        TestScript(tst_filename, keyboard).run()
+    except Failure as e:
+        return tst_filename, 'failed', str(e), time.time() - start
+    except Skipped as e:
+        return tst_filename, 'skipped', str(e), time.time() - start
+    except Exception as e:
+        return tst_filename, 'error', '{}: {}'.format(type(e).__name__, e), time.time() - start
+    return tst_filename, 'passed', None, time.time() - start
+
+
+def find_tst_files(paths):
+    '''Expand files and directories (searched recursively)'''
+    tst_files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in sorted(os.walk(path)):
+                dirnames.sort()
+                tst_files.extend(os.path.join(dirpath, filename)
+                    for filename in sorted(filenames) if filename.endswith('.tst'))
+        else:
+            tst_files.append(path)
+    return tst_files
+
+
+def run_all(tst_files, jobs=1, keyboard=False):
+    '''Run independent scripts across a process pool; yields run_test results in order'''
+    run = partial(run_test, keyboard=keyboard)
+    if jobs == 1 or len(tst_files) <= 1:
+        for tst_file in tst_files:
+            yield run(tst_file)
+        return
+    pool = Pool(jobs)
+    try:
+        for result in pool.imap(run, tst_files):
+            yield result
+    finally:
+        pool.close()
+        pool.join()
+
+
+def write_junit(results, seconds, junit_filename):
+    '''Write results as a JUnit XML report, one testcase per script'''
+    from xml.etree import ElementTree
+
+    suite = ElementTree.Element('testsuite', name='nand2tetris', tests=str(len(results)),
+        failures=str(sum(1 for r in results if r[1] == 'failed')),
+        errors=str(sum(1 for r in results if r[1] == 'error')),
+        skipped=str(sum(1 for r in results if r[1] == 'skipped')),
+        time='{:.3f}'.format(seconds))
+    for tst_filename, status, message, test_seconds in results:
+        directory, filename = os.path.split(os.path.relpath(tst_filename))
+        case = ElementTree.SubElement(suite, 'testcase',
+            classname=directory.replace(os.sep, '.'), name=os.path.splitext(filename)[0],
+            time='{:.3f}'.format(test_seconds))
+        if status == 'failed':
+            ElementTree.SubElement(case, 'failure', message=message)
+        elif status == 'error':
+            ElementTree.SubElement(case, 'error', message=message)
+        elif status == 'skipped':
+            ElementTree.SubElement(case, 'skipped', message=message)
+    ElementTree.ElementTree(suite).write(junit_filename, encoding='utf-8', xml_declaration=True)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(description='Run .tst scripts and compare with .cmp files')
+    arg_parser.add_argument('paths', nargs='+', help='.tst files or directories')
+    arg_parser.add_argument('-j', '--jobs', type=int, default=1,
+        help='worker processes, 0 for one per core (default: 1)')
+    arg_parser.add_argument('--junit', metavar='FILE', help='write a JUnit XML report')
+    arg_parser.add_argument('--keyboard', action='store_true',
+        help='press the keys that scripts wait for instead of skipping them')
+    args = arg_parser.parse_args()
+
+    start = time.time()
+    results = []
+    for result in run_all(find_tst_files(args.paths), args.jobs or None, args.keyboard):
+        tst_filename, status, message, seconds = result
+        print('{}: {} ({:.2f}s){}'.format(tst_filename, status, seconds,
+            ': ' + message if message else ''))
+        results.append(result)
+    seconds = time.time() - start
+
+    counts = dict((status, sum(1 for r in results if r[1] == status))
+        for status in ('passed', 'failed', 'error', 'skipped'))
+    print('{passed} passed, {failed} failed, {error} errors, {skipped} skipped'.format(**counts)
+        + ' in {:.2f}s'.format(seconds))
+    if args.junit:
+        write_junit(results, seconds, args.junit)
+    sys.exit(1 if counts['failed'] or counts['error'] else 0)